@@ -0,0 +1,123 @@
+import heapq
+import asyncio
+import threading
+
+# Per-item circulation totals and top holders, kept up to date by every inventory change.
+# Each item has a max-heap of (-quantity, user_id) entries. An update pushes a fresh entry in
+# O(log n) and leaves the old one behind; stale entries are skipped when reading the top and
+# the heap is rebuilt once they outnumber the live ones.
+# The index is built on the persistence thread when the bank is opened, so reading every
+# inventory never stalls the event loop. Changes made while it is being built are queued and
+# applied once it is in; readers wait for it with wait_built().
+class ItemIndex:
+    def __init__(self):
+        self._totals = {}
+        self._holdings = {}  # item -> {user_id: quantity}
+        self._heaps = {}
+        self._built = threading.Event()
+        # Guards _pending, the updates made while a build is running (None when none is)
+        self._lock = threading.Lock()
+        self._pending = None
+
+    @property
+    def built(self):
+        return self._built.is_set()
+
+    # Build from `scan`, a callable returning every (user_id, inventory), on the persistence
+    # thread under `task`. Inventories changed after `scan` was set up must reach update().
+    def build_in_background(self, worker, task, scan):
+        with self._lock:
+            self._built.clear()
+            self._pending = []
+        worker.schedule(task, lambda: self.build(scan()))
+
+    # Wait on the event loop until the index is built
+    async def wait_built(self):
+        if not self.built:
+            await asyncio.to_thread(self._built.wait)
+
+    def build(self, inventories):
+        holdings = {}
+        for user_id, inventory in inventories:
+            for item, quantity in inventory.items():
+                if quantity > 0:
+                    holdings.setdefault(item, {})[user_id] = quantity
+        totals = {item: sum(item_holdings.values()) for item, item_holdings in holdings.items()}
+        heaps = {}
+        for item, item_holdings in holdings.items():
+            heaps[item] = [(-quantity, user_id) for user_id, quantity in item_holdings.items()]
+            heapq.heapify(heaps[item])
+        with self._lock:
+            self._holdings, self._totals, self._heaps = holdings, totals, heaps
+            for update in self._pending or ():
+                self._apply(*update)
+            # Set last: update() only skips the lock once _pending is None, by then the build is in
+            self._built.set()
+            self._pending = None
+
+    def _rebuild_heap(self, item):
+        heap = [(-quantity, user_id) for user_id, quantity in self._holdings[item].items()]
+        heapq.heapify(heap)
+        self._heaps[item] = heap
+
+    # Record that a user now holds `quantity` of an item
+    def update(self, user_id, item, quantity):
+        if self._pending is not None:
+            with self._lock:
+                if self._pending is not None:
+                    self._pending.append((user_id, item, quantity))
+                    return
+        if self.built:
+            self._apply(user_id, item, quantity)
+
+    def _apply(self, user_id, item, quantity):
+        holdings = self._holdings.setdefault(item, {})
+        previous = holdings.get(user_id, 0)
+        if quantity == previous:
+            return
+        total = self._totals.get(item, 0) + quantity - previous
+        if total:
+            self._totals[item] = total
+        else:
+            self._totals.pop(item, None)
+        if quantity > 0:
+            holdings[user_id] = quantity
+            heapq.heappush(self._heaps.setdefault(item, []), (-quantity, user_id))
+        else:
+            holdings.pop(user_id, None)
+        if not holdings:
+            del self._holdings[item]
+            self._heaps.pop(item, None)
+        elif len(self._heaps[item]) > 2 * len(holdings) + 16:
+            self._rebuild_heap(item)
+
+    # Item -> total quantity held across the bank
+    def totals(self):
+        self._built.wait()
+        return self._totals
+
+    def holder_count(self, item):
+        self._built.wait()
+        return len(self._holdings.get(item, ()))
+
+    # The n largest holders of an item as (user_id, quantity), largest first
+    def top(self, item, n=10):
+        self._built.wait()
+        heap = self._heaps.get(item)
+        if not heap:
+            return []
+        holdings = self._holdings[item]
+        result = []
+        popped = []
+        seen = set()
+        while heap and len(result) < n:
+            entry = heapq.heappop(heap)
+            quantity, user_id = -entry[0], entry[1]
+            if holdings.get(user_id) != quantity or user_id in seen:
+                continue  # Stale entry from an earlier update
+            seen.add(user_id)
+            result.append((user_id, quantity))
+            popped.append(entry)
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return result
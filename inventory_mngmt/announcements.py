@@ -0,0 +1,89 @@
+import asyncio
+
+import interactions
+
+from metrics import metrics
+from dispatcher import dispatcher, PRIORITY_ANNOUNCEMENT
+
+# Seconds announcements are held back so changes made close together share one message
+ANNOUNCE_WINDOW = 3.0
+# Characters per digest, Discord caps embed descriptions at 4096
+DIGEST_CHARS = 3500
+ANNOUNCE_COLOR = 0xffa500
+
+def digest_embed(entries):
+    titles = {title for title, _ in entries}
+    if len(entries) == 1:
+        description = entries[0][1]
+    else:
+        description = "\n".join(f"• {description}" for _, description in entries)
+    return interactions.Embed(
+        title=titles.pop() if len(titles) == 1 else "Bank Updates",
+        description=description,
+        color=ANNOUNCE_COLOR
+    )
+
+# Split entries into digests that fit in one embed each
+def split_digests(entries):
+    digests = []
+    current, size = [], 0
+    for title, description in entries:
+        length = len(description[:DIGEST_CHARS]) + 3
+        if current and size + length > DIGEST_CHARS:
+            digests.append(current)
+            current, size = [], 0
+        current.append((title, description[:DIGEST_CHARS]))
+        size += length
+    if current:
+        digests.append(current)
+    return digests
+
+# Public announcements of bank changes, batched per channel.
+# A command's announcement is buffered and a single digest embed is queued on the outbound
+# dispatcher once the window has passed, so a payout burst costs one message instead of one
+# per change and never holds up a handler. The digest is sent as a follow-up to the most
+# recent interaction in the channel, like the individual announcements were, so no extra
+# channel permissions are needed.
+class AnnouncementAggregator:
+    def __init__(self, window=ANNOUNCE_WINDOW):
+        self.window = window
+        self._pending = {}  # channel_id -> (latest ctx, [(title, description)])
+        self._timers = {}
+
+    async def announce(self, ctx, description, title="Inventory Update"):
+        channel_id = int(ctx.channel_id)
+        _, entries = self._pending.get(channel_id, (None, []))
+        entries.append((title, description))
+        self._pending[channel_id] = (ctx, entries)
+        if channel_id not in self._timers:
+            self._timers[channel_id] = asyncio.create_task(self._flush_later(channel_id))
+
+    async def _flush_later(self, channel_id):
+        await asyncio.sleep(self.window)
+        self._timers.pop(channel_id, None)
+        await self.flush(channel_id)
+
+    async def flush(self, channel_id):
+        ctx, entries = self._pending.pop(channel_id, (None, []))
+        for digest in split_digests(entries):
+            embed = digest_embed(digest)
+            dispatcher.post(
+                f"channel:{channel_id}",
+                lambda embed=embed: ctx.send(embeds=[embed]),
+                PRIORITY_ANNOUNCEMENT,
+                description=f"a digest of {len(digest)} announcements"
+            )
+            metrics.increment("announcements_total", len(digest))
+
+    # Post everything still buffered now, e.g. before shutting down
+    async def flush_all(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for channel_id in list(self._pending):
+            await self.flush(channel_id)
+
+announcer = AnnouncementAggregator()
+metrics.gauge("outbound_queue_depth", dispatcher.pending)
+for _stat in ("sent", "retried", "rate_limited", "failed"):
+    metrics.gauge(f"outbound_{_stat}", lambda stat=_stat: dispatcher.stats[stat])
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import logging
+import resource
+import tempfile
+import tracemalloc
+
+# Offline benchmark for the inventory slash commands.
+# Builds a synthetic bank of N users x M items x K units in a scratch directory, imports the
+# bot's modules against it and calls the command callbacks with fake contexts, so it runs
+# without a token or network. Reports startup time, per-command latency percentiles, bytes
+# written by persistence and logging, and peak memory.
+#
+#   python inventory_mngmt/benchmarks/command_bench.py --users 10000 --items 20 --units 5
+#   python inventory_mngmt/benchmarks/command_bench.py --backend sqlite --json results.json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeGuild, FakeUser, FakeSlashContext
+
+COMMANDS = ["bankinv", "bankadd", "bankremove", "banktrade", "bankuse"]
+FIRST_USER_ID = 100000000000000000
+ADMIN_ID = 99999999999999999
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the inventory commands against a synthetic bank.")
+    parser.add_argument("--users", type=int, default=10000, help="users in the bank")
+    parser.add_argument("--items", type=int, default=20, help="distinct items each user holds")
+    parser.add_argument("--units", type=int, default=5, help="units of each item per user")
+    parser.add_argument("--iterations", type=int, default=500, help="calls per command")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--commands", default=",".join(COMMANDS), help="comma separated commands to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="trace Python allocations (slower, adds peak heap)")
+    parser.add_argument("--workdir", help="scratch directory, a temporary one is used by default")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--json", dest="json_path", help="also write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+def item_names(count):
+    base = ["3h Mill", "3h Industry", "Half Cut trees"]
+    return base[:count] + [f"Item {index:03d}" for index in range(len(base), count)]
+
+def user_ids(count):
+    return [str(FIRST_USER_ID + index) for index in range(count)]
+
+# Write the synthetic bank where the chosen backend expects to find the guild's bank
+def generate_bank(backend, users, items, units, guild_id):
+    directory = os.path.join('data', 'guilds', str(guild_id))
+    os.makedirs(directory, exist_ok=True)
+    inventories = ((user_id, {item: units for item in items}) for user_id in users)
+    if backend == "sqlite":
+        from sqlite_storage import SqliteStorage
+        storage = SqliteStorage(os.path.join(directory, 'bank.db'))
+        storage.replace_inventories(dict(inventories))
+        storage.close()
+    else:
+        from snapshot import snapshot_path, write_snapshot
+        write_snapshot(snapshot_path(directory, 0), 0, inventories)
+    with open(os.path.join(directory, 'roles.json'), 'w') as file:
+        json.dump({"permissions": {}, "mod_roles": []}, file)
+
+# Characters written by this process, from /proc on Linux, None elsewhere
+def bytes_written():
+    try:
+        with open('/proc/self/io') as file:
+            for line in file:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "calls": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p90_ms": percentile(values, 0.90) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+# Arguments for one call of each command, drawn from the synthetic bank
+def command_arguments(name, rng, guild, users, items):
+    def user():
+        return FakeUser(int(rng.choice(users)))
+    admin = guild.get_member(ADMIN_ID)
+    if name == "bankinv":
+        return admin, {"user": user()}
+    if name in ("bankadd", "bankremove"):
+        return admin, {"user": user(), "item": rng.choice(items), "quantity": 1}
+    if name == "banktrade":
+        from_user, to_user = rng.sample(users, 2)
+        return admin, {"item": rng.choice(items), "quantity": 1,
+                       "from_user": FakeUser(int(from_user)), "to_user": FakeUser(int(to_user))}
+    if name == "bankuse":
+        user_id = int(rng.choice(users))
+        author = guild.get_member(user_id) or guild.add_member(user_id)
+        return author, {"item": rng.choice(items), "quantity": 1}
+    raise ValueError(f"Unknown command {name}")
+
+async def run_commands(handlers, names, iterations, rng, guild, users, items):
+    from announcements import announcer
+    from dispatcher import dispatcher, LocalTransport
+    from pipeline import pipeline
+    # Discord's per-channel limits without the network, and no added latency
+    dispatcher.transport = LocalTransport()
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    contexts = []
+    for name in names:
+        callback = handlers[name].callback
+        for _ in range(iterations):
+            author, kwargs = command_arguments(name, rng, guild, users, items)
+            ctx = FakeSlashContext(author, guild)
+            contexts.append((name, ctx))
+            started = time.perf_counter()
+            await callback(ctx, **kwargs)
+            latencies[name].append(time.perf_counter() - started)
+    # Latency stops at the answer, the ledger, logs and announcements finish in the background
+    await pipeline.drain()
+    await announcer.flush_all()
+    await dispatcher.drain()
+    for name, ctx in contexts:
+        if any(message.content and str(message.content).startswith("Error:") for message in ctx.sent):
+            errors[name] += 1
+    return latencies, errors, sum(len(ctx.sent) for _, ctx in contexts)
+
+def run(args):
+    os.environ["storage_backend"] = args.backend
+    # A hosted logo keeps the handlers from reading assets/ on every send
+    os.environ["logo_url"] = "https://cdn.invalid/cgcg.png"
+    os.makedirs('data', exist_ok=True)
+
+    users = user_ids(args.users)
+    items = item_names(args.items)
+    generate_started = time.perf_counter()
+    guild = FakeGuild()
+    generate_bank(args.backend, users, items, args.units, guild.id)
+    generate_seconds = time.perf_counter() - generate_started
+
+    if args.memory:
+        tracemalloc.start()
+    startup_started = time.perf_counter()
+    import config
+    bank = config.get_bank(guild.id)
+    startup_seconds = time.perf_counter() - startup_started
+    startup_heap = tracemalloc.get_traced_memory()[1] if args.memory else None
+    loaded_at_startup = len(bank.user_inventories.loaded_items())
+
+    import log_sink
+    from persistence import worker
+    from dispatcher import dispatcher
+    from commands import inventory
+    # Keep the console quiet, the handlers log every call at INFO and the activity logs echo there too
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("cgbank.activity").propagate = False
+
+    guild.add_member(ADMIN_ID, administrator=True, display_name="bench-admin")
+    names = [name.strip() for name in args.commands.split(",") if name.strip()]
+    handlers = {name: getattr(inventory, name) for name in names}
+
+    written_before = bytes_written()
+    disk_before = directory_size('data') + directory_size('logs')
+    rng = random.Random(args.seed)
+    latencies, errors, messages_sent = asyncio.run(run_commands(handlers, names, args.iterations, rng, guild, users, items))
+
+    flush_started = time.perf_counter()
+    worker.flush()
+    flush_seconds = time.perf_counter() - flush_started
+    log_sink.stop()
+    written_after = bytes_written()
+    disk_after = directory_size('data') + directory_size('logs')
+
+    results = {
+        "backend": args.backend,
+        "users": args.users,
+        "items": args.items,
+        "units": args.units,
+        "iterations": args.iterations,
+        "generate_seconds": generate_seconds,
+        "startup_seconds": startup_seconds,
+        "users_loaded_at_startup": loaded_at_startup,
+        "users_loaded_after_run": len(bank.user_inventories.loaded_items()),
+        "final_flush_seconds": flush_seconds,
+        "discord_messages": messages_sent,
+        "outbound": dict(dispatcher.stats),
+        "bytes_written": None if written_before is None else written_after - written_before,
+        "disk_growth_bytes": disk_after - disk_before,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "commands": {name: dict(summarize(latencies[name]), errors=errors[name]) for name in names},
+    }
+    if args.memory:
+        results["startup_peak_heap_bytes"] = startup_heap
+        results["peak_heap_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    worker.shutdown()
+    return results
+
+def print_results(results):
+    print(f"backend={results['backend']} users={results['users']} items={results['items']} "
+          f"units={results['units']} iterations={results['iterations']}")
+    print(f"bank generated in {results['generate_seconds']:.2f}s, "
+          f"startup {results['startup_seconds'] * 1000:.1f}ms with {results['users_loaded_at_startup']} users loaded "
+          f"({results['users_loaded_after_run']} after the run)")
+    print(f"{'command':<12}{'calls':>7}{'errors':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, stats in results["commands"].items():
+        print(f"{name:<12}{stats['calls']:>7}{stats['errors']:>8}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>10.3f}"
+              f"{stats['p90_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+    outbound = ", ".join(f"{name} {count}" for name, count in sorted(results["outbound"].items()))
+    print(f"discord messages sent: {results['discord_messages']} (queued: {outbound or 'none'})")
+    written = results["bytes_written"]
+    print(f"persisted: {'n/a' if written is None else f'{written:,} bytes written'}, "
+          f"disk grew by {results['disk_growth_bytes']:,} bytes, final flush {results['final_flush_seconds'] * 1000:.1f}ms")
+    memory = f"memory: max RSS {results['max_rss_kib']:,} KiB"
+    if "peak_heap_bytes" in results:
+        memory += (f", Python heap peak {results['startup_peak_heap_bytes']:,} bytes at startup, "
+                   f"{results['peak_heap_bytes']:,} bytes overall")
+    print(memory)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cgbank-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = run(args)
+    finally:
+        os.chdir(previous)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as file:
+            json.dump(results, file, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import time
+import itertools
+from types import SimpleNamespace
+
+import interactions
+
+# Stand-ins for the parts of interactions.py the command handlers touch.
+# Nothing here talks to Discord: sends are recorded on the context and return a fake message.
+
+class FakeRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+
+class FakeUser:
+    def __init__(self, user_id, display_name=None):
+        self.id = user_id
+        self.display_name = display_name or f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+class FakeMember(FakeUser):
+    def __init__(self, user_id, guild, roles=(), administrator=False, display_name=None):
+        super().__init__(user_id, display_name)
+        self.guild = guild
+        self.roles = list(roles)
+        self.administrator = administrator
+
+    def has_permission(self, *permissions):
+        return self.administrator or interactions.Permissions.ADMINISTRATOR not in permissions
+
+class FakeGuild:
+    def __init__(self, guild_id=1, name="Benchmark Guild", roles=()):
+        self.id = guild_id
+        self.name = name
+        self.roles = list(roles)
+        self._members = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def add_member(self, user_id, **kwargs):
+        member = FakeMember(user_id, self, **kwargs)
+        self._members[int(user_id)] = member
+        return member
+
+    def get_member(self, user_id):
+        return self._members.get(int(user_id))
+
+# A message or ephemeral reply that would have been sent
+class SentMessage:
+    def __init__(self, content, embeds, files, ephemeral):
+        self.content = content
+        self.embeds = embeds or []
+        self.files = files or []
+        self.ephemeral = ephemeral
+        self.sent_at = time.perf_counter()
+        self.attachments = [
+            SimpleNamespace(filename=file.file_name, url=f"https://cdn.invalid/{file.file_name}")
+            for file in self.files
+        ]
+
+# Interaction IDs, unique per context like Discord's
+_interaction_ids = itertools.count(1)
+
+class FakeSlashContext:
+    def __init__(self, author, guild, channel_id=1):
+        self.id = next(_interaction_ids)
+        self.author = author
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel_id = channel_id
+        self.sent = []
+        self.deferred = False
+
+    async def defer(self, ephemeral=False):
+        self.deferred = True
+
+    async def send(self, content=None, embeds=None, files=None, ephemeral=False, **kwargs):
+        message = SentMessage(content, embeds, files, ephemeral)
+        self.sent.append(message)
+        return message
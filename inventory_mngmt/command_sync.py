@@ -0,0 +1,54 @@
+import os
+import json
+import asyncio
+import hashlib
+
+import interactions
+
+from persistence import write_json_atomic
+
+# Hash of the command schema last synced to each scope, so unchanged scopes are skipped on restart
+SYNC_STATE_FILE = 'data/command_sync.json'
+# Most scopes synced with Discord at the same time
+SYNC_CONCURRENCY = 4
+
+def load_sync_state(path=SYNC_STATE_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            return json.load(file)
+    return {}
+
+def schema_hash(commands_json):
+    commands_json = sorted(commands_json, key=lambda command: command.get("name", ""))
+    return hashlib.sha256(json.dumps(commands_json, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+# Sync the global commands and each guild's commands, a few scopes at a time.
+# Scopes whose schema hash matches the last successful sync are not touched at all.
+# When the bot runs as several shards only one of them syncs the global commands, and each
+# keeps its own state file. Returns (synced, skipped, failed) lists of scopes.
+async def sync_commands(bot, guilds, include_global=True, state_file=SYNC_STATE_FILE):
+    local_commands = interactions.application_commands_to_dict(bot.interactions_by_scope, bot)
+    state = load_sync_state(state_file)
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+    synced, skipped, failed = [], [], []
+
+    async def sync(scope, name):
+        key = f"{bot.app.id}:{int(scope)}"
+        digest = schema_hash(local_commands.get(scope, []))
+        if state.get(key) == digest:
+            skipped.append(name)
+            return
+        async with semaphore:
+            try:
+                await bot.sync_scope(scope, bot.del_unused_app_cmd, local_commands)
+                state[key] = digest
+                synced.append(name)
+            except Exception as e:
+                failed.append(name)
+                print(f"Failed to sync commands for {name}. Error: {e}")
+
+    scopes = [(interactions.GLOBAL_SCOPE, "global commands")] if include_global else []
+    scopes += [(guild.id, f"guild: {guild.name} ({guild.id})") for guild in guilds]
+    await asyncio.gather(*(sync(scope, name) for scope, name in scopes))
+    write_json_atomic(state_file, state, indent=4)
+    return synced, skipped, failed
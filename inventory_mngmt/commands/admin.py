@@ -1,14 +1,12 @@
 import interactions
-from config import role_data, save_roles, get_logo_url
+from config import command_bank
+from metrics import instrumented, metrics
+from announcements import announcer
+from pipeline import pipeline
 
-# Helper function to make announcements
+# Helper function to make announcements, batched with others in the same channel
 async def announce_change(ctx, description):
-    embed = interactions.Embed(
-        title="Admin Update",
-        description=description,
-        color=0xffa500
-    )
-    await ctx.send(embeds=[embed])
+    await announcer.announce(ctx, description, title="Admin Update")
 
 # Command to give a user permission for a specific command
 @interactions.slash_command(
@@ -33,30 +31,36 @@ async def announce_change(ctx, description):
         )
     ]
 )
+@instrumented
 async def bankgiverole(ctx: interactions.SlashContext, user: interactions.User, command_name: str):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
     member = ctx.guild.get_member(ctx.author.id)
     if not member:
         await ctx.send("You are not a member of this guild.", ephemeral=False)
         return
 
     # Check if the user has the necessary permissions
-    if not (
-        member.has_permission(interactions.Permissions.ADMINISTRATOR) or
-        any(role.id in role_data["mod_roles"] for role in member.roles) or
-        any(role.name == "🏆 CG Dev" for role in member.roles)
-    ):
+    if not bank.is_moderator(member):
         await ctx.send("You are missing the necessary permissions to run this command.", ephemeral=False)
         return
 
-    if str(user.id) not in role_data["permissions"]:
-        role_data["permissions"][str(user.id)] = []
+    if str(user.id) not in bank.role_data["permissions"]:
+        bank.role_data["permissions"][str(user.id)] = []
     
-    role_data["permissions"][str(user.id)].append(command_name)
-    save_roles(role_data)
-    await ctx.send(f"User {user.mention} has been given permission to use `{command_name}`.", ephemeral=True)
+    if command_name not in bank.role_data["permissions"][str(user.id)]:
+        bank.role_data["permissions"][str(user.id)].append(command_name)
+    bank.save_roles()
+    bank.ledger.record("grant_permission", ctx.author.id, user.id, command=command_name)
+    bank.roster_index.permissions_updated(ctx.guild_id, user.id)
 
-    # Announce the change
-    await announce_change(ctx, f"User {user.mention} has been given permission to use `{command_name}`.")
+    # Answer now, then announce the change
+    await pipeline.finish(
+        ctx, "bankgiverole",
+        lambda: announce_change(ctx, f"User {user.mention} has been given permission to use `{command_name}`."),
+        content=f"User {user.mention} has been given permission to use `{command_name}`."
+    )
 
 # Command to remove a user's permission for a specific command
 @interactions.slash_command(
@@ -81,27 +85,102 @@ async def bankgiverole(ctx: interactions.SlashContext, user: interactions.User,
         )
     ]
 )
+@instrumented
 async def bankdroprole(ctx: interactions.SlashContext, user: interactions.User, command_name: str):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
     member = ctx.guild.get_member(ctx.author.id)
     if not member:
         await ctx.send("You are not a member of this guild.", ephemeral=False)
         return
 
     # Check if the user has the necessary permissions
-    if not (
-        member.has_permission(interactions.Permissions.ADMINISTRATOR) or
-        any(role.id in role_data["mod_roles"] for role in member.roles) or
-        any(role.name == "🏆 CG Dev" for role in member.roles)
-    ):
+    if not bank.is_moderator(member):
         await ctx.send("You are missing the necessary permissions to run this command.", ephemeral=False)
         return
 
-    if str(user.id) in role_data["permissions"] and command_name in role_data["permissions"][str(user.id)]:
-        role_data["permissions"][str(user.id)].remove(command_name)
-        save_roles(role_data)
-        await ctx.send(f"User {user.mention}'s permission to use `{command_name}` has been removed.", ephemeral=True)
-            # Announce the change
-        await announce_change(ctx, f"User {user.mention}'s permission to use `{command_name}` has been removed.")
+    if str(user.id) in bank.role_data["permissions"] and command_name in bank.role_data["permissions"][str(user.id)]:
+        bank.role_data["permissions"][str(user.id)].remove(command_name)
+        bank.save_roles()
+        bank.ledger.record("revoke_permission", ctx.author.id, user.id, command=command_name)
+        bank.roster_index.permissions_updated(ctx.guild_id, user.id)
 
+        # Answer now, then announce the change
+        await pipeline.finish(
+            ctx, "bankdroprole",
+            lambda: announce_change(ctx, f"User {user.mention}'s permission to use `{command_name}` has been removed."),
+            content=f"User {user.mention}'s permission to use `{command_name}` has been removed."
+        )
     else:
         await ctx.send(f"User {user.mention} does not have permission for `{command_name}`.", ephemeral=True)
+
+# Rows per section of /bankstats, busiest first
+STATS_ROWS = 8
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.1f}ms"
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+# One line per labelled histogram: calls, p50, p95 and max, sorted by total time spent
+def format_latencies(name, label, extra=None):
+    rows = sorted(metrics.histograms(name), key=lambda row: row[1].sum, reverse=True)[:STATS_ROWS]
+    lines = []
+    for labels, histogram in rows:
+        key = labels.get(label, "all")
+        line = (f"**{key}**: {histogram.count} calls, p50 {format_ms(histogram.quantile(0.5))}, "
+                f"p95 {format_ms(histogram.quantile(0.95))}, max {format_ms(histogram.max)}")
+        if extra:
+            line += extra(key)
+        lines.append(line)
+    return "\n".join(lines) or "Nothing recorded yet."
+
+# Command to show runtime metrics (admins and moderators only)
+@interactions.slash_command(
+    name="bankstats",
+    description="Show command latencies, persistence timings and queue depths."
+)
+@instrumented
+async def bankstats(ctx: interactions.SlashContext):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    member = ctx.guild.get_member(ctx.author.id)
+    if not member or not bank.is_moderator(member):
+        await ctx.send("You are missing the necessary permissions to run this command.", ephemeral=True)
+        return
+
+    def command_errors(command):
+        errors = metrics.counter("command_errors_total", command=command)
+        return f", {errors} errors" if errors else ""
+
+    def persisted(task):
+        written = metrics.counter("persisted_bytes_total", task=task)
+        failures = metrics.counter("persist_failures_total", task=task)
+        return f", {format_bytes(written)} written" + (f", {failures} failed" if failures else "")
+
+    gauges = metrics.gauges()
+    embed = interactions.Embed(title="Bank Stats", color=0x0000ff)
+    embed.add_field(name="Commands", value=format_latencies("command_seconds", "command", command_errors), inline=False)
+    embed.add_field(name="Discord Calls", value=format_latencies("discord_send_seconds", "method"), inline=False)
+    embed.add_field(name="Saves (event loop)", value=format_latencies("save_seconds", "store"), inline=False)
+    embed.add_field(name="Persistence (background)", value=format_latencies("persist_seconds", "task", persisted), inline=False)
+    embed.add_field(
+        name="Log Writes",
+        value=format_latencies("log_write_seconds", "file") + f"\n{format_bytes(metrics.counter('persisted_bytes_total', task='logs'))} written",
+        inline=False
+    )
+    embed.add_field(
+        name="Queues",
+        value="\n".join(f"**{name}**: {value}" for name, value in sorted(gauges.items()) if name != "uptime_seconds"),
+        inline=False
+    )
+    uptime = int(gauges["uptime_seconds"])
+    embed.set_footer(text=f"Uptime {uptime // 3600}h {uptime % 3600 // 60}m")
+    await ctx.send(embeds=[embed], ephemeral=True)
@@ -0,0 +1,216 @@
+import logging
+import interactions
+from locks import user_locks
+from metrics import instrumented, metrics
+from scheduler import scheduler
+from dispatcher import dispatcher, PRIORITY_ANNOUNCEMENT
+from config import command_bank, loaded_bank, role_members, get_user_logger, get_logo_embed_url, send_with_logo
+from commands.inventory import catalog_choices, require_moderator
+
+# Lines of a grant summary before it is cut short
+GRANT_SUMMARY_LINES = 20
+
+# Discord timestamp shown in each reader's own time zone, e.g. "Friday 18:00 (in 2 hours)"
+def discord_time(timestamp):
+    return f"<t:{int(timestamp)}:f> (<t:{int(timestamp)}:R>)"
+
+# A boost ran out: drop it and let the user know by DM
+@scheduler.handler("boost")
+async def expire_boost(guild_id, key, when):
+    bank = loaded_bank(guild_id)
+    user_id, item = key
+    if bank is None or not bank.timers.expire(user_id, item, when):
+        return
+    bank.ledger.record("expire", user_id, user_id, item)
+    get_user_logger(user_id).info(f'{item} boost ran out.')
+    metrics.increment("boosts_expired_total")
+
+    embed = interactions.Embed(
+        title="Boost Ended",
+        description=f'Your {item} boost has run out.',
+        color=0xffa500
+    )
+
+    async def notify():
+        user = await scheduler.client.fetch_user(user_id)
+        if user is not None:
+            await user.send(embeds=[embed])
+    dispatcher.post(f"dm:{user_id}", notify, PRIORITY_ANNOUNCEMENT, description=f"a {item} expiry notice")
+
+# A recurring grant came up: give the item to everyone with the role and post a summary
+# where the grant was set up. The run's key makes sure a restart part way through never
+# grants it twice.
+@scheduler.handler("grant")
+async def run_grant(guild_id, grant_id, when):
+    bank = loaded_bank(guild_id)
+    grant = bank.timers.due_grant(grant_id, when) if bank is not None else None
+    if grant is None:
+        return
+    try:
+        guild = scheduler.client.get_guild(guild_id)
+        role = guild.get_role(grant["role_id"]) if guild else None
+        if role is None:
+            logging.warning(f"Skipped grant {grant_id} in guild {guild_id}, its role is gone")
+            return
+        grants = [(str(member.id), grant["item"], grant["quantity"]) for member in await role_members(role)]
+        if not grants:
+            return
+        key = f"grant:{grant_id}:{int(when)}"
+        async with user_locks.hold(*(user_id for user_id, _, _ in grants)):
+            if bank.find_processed([key]) is not None:
+                return
+            bank.add_items(grants)
+            bank.save_inventories([key])
+            for user_id, item, quantity in grants:
+                bank.ledger.record("add", grant["created_by"], user_id, item, quantity, grant=grant_id)
+                get_user_logger(user_id).info(f'Received {quantity}x {item} from a recurring grant.')
+        metrics.increment("grants_run_total")
+
+        lines = [f"<@{user_id}>: {quantity}x {item}" for user_id, item, quantity in grants]
+        if len(lines) > GRANT_SUMMARY_LINES:
+            lines = lines[:GRANT_SUMMARY_LINES] + [f"...and {len(lines) - GRANT_SUMMARY_LINES} more"]
+        embed = interactions.Embed(
+            title="Recurring Grant",
+            description=f'Gave {grant["quantity"]}x {grant["item"]} to {len(grants)} members of {role.mention}.\n\n' + "\n".join(lines),
+            color=0x00ff00
+        )
+        channel = scheduler.client.get_channel(grant["channel_id"])
+        if channel is not None:
+            dispatcher.post(
+                f"channel:{grant['channel_id']}",
+                lambda: channel.send(embeds=[embed]),
+                PRIORITY_ANNOUNCEMENT,
+                description=f"the summary of grant {grant_id}"
+            )
+    finally:
+        bank.timers.finish_grant(grant_id, when)
+
+# Command to show someone's running boosts
+@interactions.slash_command(
+    name="bankboosts",
+    description="See which boosts are running and when they run out.",
+    options=[
+        interactions.SlashCommandOption(
+            name="user",
+            description="User to view boosts of",
+            type=interactions.OptionType.USER,
+            required=False
+        )
+    ]
+)
+@instrumented
+async def bankboosts(ctx: interactions.SlashContext, user: interactions.User = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    user = user or ctx.author
+    boosts = bank.timers.active_boosts(user.id)
+    embed = interactions.Embed(
+        title=f"{user.display_name}'s Boosts",
+        description="\n".join(f"{item} until {discord_time(expires)}" for item, expires in boosts) or 'No boosts running.',
+        color=0xffa500
+    )
+    embed.set_thumbnail(url=get_logo_embed_url())
+    await send_with_logo(ctx, [embed], ephemeral=True)
+
+def format_grant(grant):
+    return (f"**#{grant['id']}** {grant['quantity']}x {grant['item']} to <@&{grant['role_id']}>, "
+            f"`{grant['cron']}`, next {discord_time(grant['next_run'])}")
+
+# Command to set up a recurring grant, e.g. the weekly CG Pass payout (admins and moderators only)
+@interactions.slash_command(
+    name="bankschedule",
+    description="Give an item to everyone with a role on a schedule, e.g. weekly CG Pass payouts.",
+    options=[
+        interactions.SlashCommandOption(
+            name="role",
+            description="Give the item to every member with this role",
+            type=interactions.OptionType.ROLE,
+            required=True
+        ),
+        interactions.SlashCommandOption(
+            name="item",
+            description="Item to give",
+            type=interactions.OptionType.STRING,
+            autocomplete=True,
+            required=True
+        ),
+        interactions.SlashCommandOption(
+            name="quantity",
+            description="Quantity to give each member",
+            type=interactions.OptionType.INTEGER,
+            required=True
+        ),
+        interactions.SlashCommandOption(
+            name="cron",
+            description="When to give it as a cron expression in UTC, e.g. 0 18 * * 5 for Fridays at 18:00",
+            type=interactions.OptionType.STRING,
+            required=True
+        )
+    ]
+)
+@instrumented
+async def bankschedule(ctx: interactions.SlashContext, role: interactions.Role, item: str, quantity: int, cron: str):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    if not await require_moderator(ctx, bank):
+        return
+    try:
+        grant = bank.timers.add_grant(role.id, item, quantity, cron.strip(), ctx.channel_id, ctx.author.id)
+        bank.ledger.record("schedule_grant", ctx.author.id, role.id, item, quantity, grant=grant["id"], cron=grant["cron"])
+        await ctx.send(f"Scheduled {format_grant(grant)}. The summary of each run is posted in this channel.", ephemeral=True)
+    except Exception as e:
+        await ctx.send(f"Error: {str(e)}", ephemeral=True)
+
+# Command to list the recurring grants (admins and moderators only)
+@interactions.slash_command(
+    name="bankschedules",
+    description="List the recurring grants."
+)
+@instrumented
+async def bankschedules(ctx: interactions.SlashContext):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    if not await require_moderator(ctx, bank):
+        return
+    grants = sorted(bank.timers.grants.values(), key=lambda grant: grant["next_run"])
+    embed = interactions.Embed(
+        title="Recurring Grants",
+        description="\n".join(format_grant(grant) for grant in grants)[:4000] or 'Nothing is scheduled.',
+        color=0x0000ff
+    )
+    await ctx.send(embeds=[embed], ephemeral=True)
+
+# Command to stop a recurring grant (admins and moderators only)
+@interactions.slash_command(
+    name="bankunschedule",
+    description="Stop a recurring grant.",
+    options=[
+        interactions.SlashCommandOption(
+            name="grant_id",
+            description="Number of the grant, as shown by /bankschedules",
+            type=interactions.OptionType.INTEGER,
+            required=True
+        )
+    ]
+)
+@instrumented
+async def bankunschedule(ctx: interactions.SlashContext, grant_id: int):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    if not await require_moderator(ctx, bank):
+        return
+    grant = bank.timers.remove_grant(grant_id)
+    if grant is None:
+        await ctx.send(f"There is no grant #{grant_id}.", ephemeral=True)
+        return
+    bank.ledger.record("unschedule_grant", ctx.author.id, grant["role_id"], grant["item"], grant["quantity"], grant=grant_id)
+    await ctx.send(f"Stopped {format_grant(grant)}.", ephemeral=True)
+
+@bankschedule.autocomplete("item")
+@instrumented
+async def bankschedule_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=catalog_choices(ctx.input_text))
@@ -0,0 +1,46 @@
+import interactions
+from config import loaded_bank
+
+# Keep cached permission and roster data in step with the guild.
+# Only banks that are already open have anything cached, others are left closed.
+
+@interactions.listen(interactions.events.MemberUpdate)
+async def on_member_update(event: interactions.events.MemberUpdate):
+    bank = loaded_bank(event.guild_id)
+    if bank:
+        bank.permission_resolver.invalidate_member(event.guild_id, event.after.id)
+        bank.roster_index.member_updated(event.guild_id, event.after)
+
+@interactions.listen(interactions.events.MemberAdd)
+async def on_member_add(event: interactions.events.MemberAdd):
+    bank = loaded_bank(event.guild_id)
+    if bank:
+        bank.roster_index.permissions_updated(event.guild_id, event.member.id)
+
+@interactions.listen(interactions.events.MemberRemove)
+async def on_member_remove(event: interactions.events.MemberRemove):
+    bank = loaded_bank(event.guild_id)
+    if bank:
+        bank.permission_resolver.invalidate_member(event.guild_id, event.member.id)
+        bank.roster_index.member_removed(event.guild_id, event.member.id)
+
+@interactions.listen(interactions.events.RoleCreate)
+async def on_role_create(event: interactions.events.RoleCreate):
+    bank = loaded_bank(event.guild_id)
+    if bank:
+        bank.permission_resolver.invalidate_guild(event.guild_id)
+        bank.roster_index.invalidate_guild(event.guild_id)
+
+@interactions.listen(interactions.events.RoleUpdate)
+async def on_role_update(event: interactions.events.RoleUpdate):
+    bank = loaded_bank(event.guild_id)
+    if bank:
+        bank.permission_resolver.invalidate_guild(event.guild_id)
+        bank.roster_index.invalidate_guild(event.guild_id)
+
+@interactions.listen(interactions.events.RoleDelete)
+async def on_role_delete(event: interactions.events.RoleDelete):
+    bank = loaded_bank(event.guild_id)
+    if bank:
+        bank.permission_resolver.invalidate_guild(event.guild_id)
+        bank.roster_index.invalidate_guild(event.guild_id)
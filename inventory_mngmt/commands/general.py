@@ -1,7 +1,42 @@
-import os
+import re
+import time
 import interactions
-from interactions import Embed, File
-from config import role_data, get_logo_url, get_user_logger, get_bot_logger
+from config import get_bank, command_bank, ensure_members, get_logo_embed_url, send_with_logo, user_log_path
+from log_reader import read_lines_backwards
+from ledger import day_of
+from metrics import instrumented
+
+# Number of log lines shown per page of /banklogs
+LOGS_PER_PAGE = 15
+# Keep each page comfortably inside Discord's 4096 character embed description limit
+LOGS_PAGE_CHARS = 3900
+
+# Build the embed and buttons for the page of a user's logs ending at byte offset `end`.
+# Offsets count from the start of the user's oldest archived segment, so they stay valid across rotations.
+def build_logs_page(user_id, title, end=None):
+    lines, cursor = read_lines_backwards(user_log_path(user_id), end, LOGS_PER_PAGE, LOGS_PAGE_CHARS)
+    logs = "\n".join(lines)
+    embed = interactions.Embed(
+        title=title,
+        description=f"```\n{logs}\n```",
+        color=0xffd700
+    )
+    embed.set_thumbnail(url=get_logo_embed_url())
+    buttons = interactions.ActionRow(
+        interactions.Button(
+            style=interactions.ButtonStyle.SECONDARY,
+            label="Older",
+            custom_id=f"banklogs:{user_id}:{cursor}",
+            disabled=cursor == 0
+        ),
+        interactions.Button(
+            style=interactions.ButtonStyle.SECONDARY,
+            label="Newest",
+            custom_id=f"banklogs:{user_id}:latest",
+            disabled=end is None
+        )
+    )
+    return embed, [buttons], cursor, bool(lines)
 
 # Command to view logs of a specific user (accessible by all users)
 @interactions.slash_command(
@@ -13,32 +48,124 @@ from config import role_data, get_logo_url, get_user_logger, get_bot_logger
             description="User to view logs of",
             type=interactions.OptionType.USER,
             required=False
+        ),
+        interactions.SlashCommandOption(
+            name="page",
+            description="Page to show, 1 is the most recent activity",
+            type=interactions.OptionType.INTEGER,
+            required=False,
+            min_value=1
         )
     ]
 )
-async def banklogs(ctx: interactions.SlashContext, user: interactions.User = None):
+@instrumented
+async def banklogs(ctx: interactions.SlashContext, user: interactions.User = None, page: int = 1):
     if user is None:
         user = ctx.author  # Default to the command invoker if no user is specified
     user_id = str(user.id)
-    log_file_path = f'logs/{user_id}.log'
-    if os.path.exists(log_file_path):
-        with open(log_file_path, 'r') as log_file:
-            logs = log_file.read()
-        embed = interactions.Embed(
-            title=f"Logs for {user.display_name}",
-            description=f"```\n{logs}\n```",
-            color=0xffd700
-        )
-        embed.set_thumbnail(url="attachment://cgcg.png")
-        await ctx.send(embeds=[embed], files=[interactions.File(file=open(get_logo_url(), 'rb'), file_name="cgcg.png")], ephemeral = True)
+    title = f"Logs for {user.display_name}"
+    embed, components, cursor, has_logs = build_logs_page(user_id, title)
+    # Older pages are reached by walking back from the newest one
+    for _ in range(page - 1):
+        if not cursor:
+            break
+        embed, components, cursor, has_logs = build_logs_page(user_id, title, cursor)
+    if has_logs:
+        await send_with_logo(ctx, [embed], components=components, ephemeral=True)
     else:
         embed = interactions.Embed(
             title="No Logs Found",
             description=f'No logs found for {user.display_name}. Seems squeaky clean!',
             color=0xff0000
         )
-        embed.set_thumbnail(url="attachment://cgcg.png")
-        await ctx.send(embeds=[embed], files=[interactions.File(file=open(get_logo_url(), 'rb'), file_name="cgcg.png")], ephemeral = True)
+        embed.set_thumbnail(url=get_logo_embed_url())
+        await send_with_logo(ctx, [embed], ephemeral=True)
+
+# Older / Newest buttons on /banklogs, the custom ID carries the byte offset of the page
+@interactions.component_callback(re.compile(r"^banklogs:\d+:(\d+|latest)$"))
+@instrumented
+async def banklogs_page(ctx: interactions.ComponentContext):
+    _, user_id, cursor = ctx.custom_id.split(":")
+    end = None if cursor == "latest" else int(cursor)
+    title = ctx.message.embeds[0].title if ctx.message and ctx.message.embeds else "Logs"
+    embed, components, _, _ = build_logs_page(user_id, title, end)
+    await ctx.edit_origin(embeds=[embed], components=components)
+
+
+# Number of ledger entries shown by /bankhistory
+HISTORY_LIMIT = 15
+
+# One line of /bankhistory for a ledger event
+def format_ledger_event(event):
+    when = time.strftime('%Y-%m-%d %H:%M', time.gmtime(event["ts"]))
+    kind = event["kind"]
+    quantity = event.get("quantity")
+    item = event.get("item")
+    if kind == "add" and "grant" in event:
+        change = f"+{quantity} {item}, recurring grant #{event['grant']}"
+    elif kind == "add":
+        change = f"+{quantity} {item}, added by <@{event['actor']}>"
+    elif kind == "remove":
+        change = f"-{quantity} {item}, removed by <@{event['actor']}>"
+    elif kind == "trade_in":
+        change = f"+{quantity} {item} from <@{event['counterparty']}>"
+    elif kind == "trade_out":
+        change = f"-{quantity} {item} to <@{event['counterparty']}>"
+    elif kind == "use" and "expires" in event:
+        change = f"-{quantity} {item}, used until <t:{int(event['expires'])}:f>"
+    elif kind == "use":
+        change = f"-{quantity} {item}, used"
+    elif kind == "expire":
+        change = f"{item} boost ran out"
+    elif kind == "grant_permission":
+        change = f"`{event['command']}` granted by <@{event['actor']}>"
+    elif kind == "revoke_permission":
+        change = f"`{event['command']}` revoked by <@{event['actor']}>"
+    else:
+        change = f"{kind} {quantity or ''} {item or ''}".strip()
+    return f"`{when}` {change}"
+
+# Command to view structured bank history from the ledger
+@interactions.slash_command(
+    name="bankhistory",
+    description="See what went in and out of someone's inventory.",
+    options=[
+        interactions.SlashCommandOption(
+            name="user",
+            description="User to view history of",
+            type=interactions.OptionType.USER,
+            required=False
+        ),
+        interactions.SlashCommandOption(
+            name="item",
+            description="Only show this item",
+            type=interactions.OptionType.STRING,
+            required=False
+        ),
+        interactions.SlashCommandOption(
+            name="days",
+            description="How many days back to look (default 30)",
+            type=interactions.OptionType.INTEGER,
+            required=False,
+            min_value=1
+        )
+    ]
+)
+@instrumented
+async def bankhistory(ctx: interactions.SlashContext, user: interactions.User = None, item: str = None, days: int = 30):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    user = user or ctx.author
+    since_day = day_of(time.time() - days * 24 * 60 * 60)
+    events = bank.ledger.history(user.id, item=item, since_day=since_day, limit=HISTORY_LIMIT)
+    embed = interactions.Embed(
+        title=f"History for {user.display_name}",
+        description="\n".join(format_ledger_event(event) for event in events) or f'Nothing recorded in the last {days} days.',
+        color=0xffd700
+    )
+    embed.set_thumbnail(url=get_logo_embed_url())
+    await send_with_logo(ctx, [embed], ephemeral=True)
 
 
 #Explains all the commands in the bot
@@ -46,6 +173,7 @@ async def banklogs(ctx: interactions.SlashContext, user: interactions.User = Non
     name="bankhelp",
     description="List all commands with descriptions and examples."
 )
+@instrumented
 async def bankhelp(ctx: interactions.SlashContext):
     embed = interactions.Embed(
         title="CG Bank Commands",
@@ -68,14 +196,30 @@ async def bankhelp(ctx: interactions.SlashContext):
                 "description": "Remove an item from someone's inventory.",
                 "example": "/bankremoveitem @username item_name"
             },
+            "bankbulkadd": {
+                "description": "Add items to everyone with a role, or to each user listed in a CSV file. Moderators only.",
+                "example": "/bankbulkadd @CG Pass 3h Mill 8 or /bankbulkadd file:payout.csv"
+            },
             "banktrade": {
                 "description": "Trade an item from one user to another. Sharing is caring!",
                 "example": "/banktrade item_name @from_user @to_user"
             },
             "bankuse": {
-                "description": "Use an item from the inventory. They exist to be used!",
+                "description": "Use an item from the inventory. They exist to be used! Boosts like 3h Mill start running.",
                 "example": "/bankuse item_name"
             },
+            "bankboosts": {
+                "description": "See which boosts are running and when they run out.",
+                "example": "/bankboosts or /bankboosts @username"
+            },
+            "bankleaderboard": {
+                "description": "See who holds the most of an item.",
+                "example": "/bankleaderboard 3h Mill"
+            },
+            "banksupply": {
+                "description": "See how much of each item is held across the bank.",
+                "example": "/banksupply or /banksupply 3h Mill"
+            },
         },
         "Admin Commands": {
             "bankgiverole": {
@@ -85,6 +229,22 @@ async def bankhelp(ctx: interactions.SlashContext):
             "bankdroprole": {
                 "description": "Remove a user's permission for a specific command.",
                 "example": "/bankdroprole @username @command"
+            },
+            "bankschedule": {
+                "description": "Give an item to everyone with a role on a schedule, e.g. weekly CG Pass payouts.",
+                "example": "/bankschedule @CG Pass 3h Mill 8 0 18 * * 5"
+            },
+            "bankschedules": {
+                "description": "List the recurring grants.",
+                "example": "/bankschedules"
+            },
+            "bankunschedule": {
+                "description": "Stop a recurring grant.",
+                "example": "/bankunschedule 1"
+            },
+            "bankstats": {
+                "description": "Show command latencies, persistence timings and queue depths.",
+                "example": "/bankstats"
             }
         },
         "Other Commands": {
@@ -92,6 +252,10 @@ async def bankhelp(ctx: interactions.SlashContext):
                 "description": "Sneak a peek at someone's activity logs. Shhh, it's a secret!",
                 "example": "/viewlogs @username"
             },
+            "bankhistory": {
+                "description": "See what went in and out of someone's inventory.",
+                "example": "/bankhistory @username 3h Mill 30"
+            },
             "cgpass": {
                 "description": "View perks of CG Pass and Mod details",
                 "example": "/cgpass"
@@ -110,10 +274,10 @@ async def bankhelp(ctx: interactions.SlashContext):
         for command_name, command_info in commands_dict.items():
             embed.add_field(name=f"**/{command_name}**", value=f"{command_info['description']}\n*Usage:* `{command_info['example']}`", inline=True)
 
-    embed.set_thumbnail(url="attachment://cgcg.png")
-    embed.set_author(name="CG Bank", icon_url="attachment://cgcg.png")
+    embed.set_thumbnail(url=get_logo_embed_url())
+    embed.set_author(name="CG Bank", icon_url=get_logo_embed_url())
 
-    await ctx.send(embeds=[embed], files=[interactions.File(file=open(get_logo_url(), 'rb'), file_name="cgcg.png")], ephemeral = True)
+    await send_with_logo(ctx, [embed], ephemeral=True)
 
 
 #CG Pass information and mod details
@@ -121,6 +285,7 @@ async def bankhelp(ctx: interactions.SlashContext):
     name="cgpass",
     description="Get information about the CG Pass rewards."
 )
+@instrumented
 async def cgpass(ctx: interactions.SlashContext):
     embed = interactions.Embed(
         title="CG Pass Rewards and Mods",
@@ -140,38 +305,18 @@ async def cgpass(ctx: interactions.SlashContext):
         color=0x00ff00
     )
 
-    guild = ctx.guild
-    mod_roles = list(set(role_data["mod_roles"]))  # Ensure no duplicates
-
-    # Include CG Dev role explicitly if not already included
-    cg_dev_role = next((role for role in guild.roles if role.name == "🏆 CG Dev"), None)
-    if cg_dev_role and cg_dev_role.id not in mod_roles:
-        mod_roles.append(cg_dev_role.id)
-
-    roles_and_permissions = {}
-    for role_id in mod_roles:
-        role = guild.get_role(role_id)
-        if role:
-            members = [member.mention for member in role.members]
-            if members:
-                roles_and_permissions[role.name] = members
-
-    specific_permissions = []
-    for user_id, permissions in role_data["permissions"].items():
-        if permissions:  # Only include users with existing permissions
-            member = guild.get_member(int(user_id))
-            if member:
-                specific_permissions.append(member.mention)
-
-    if not roles_and_permissions and not specific_permissions:
-        embed.add_field(name="No Mod Roles", value="No mod roles have been assigned yet.", inline=False)
-    else:
-        for role, members in roles_and_permissions.items():
-            member_list = "\n".join(set(members))  # Ensure no duplicates
-            embed.add_field(name=role, value=member_list, inline=False)
-        if specific_permissions:
-            specific_member_list = "\n".join(set(specific_permissions))  # Ensure no duplicates
-            embed.add_field(name="Specific Command Permissions", value=specific_member_list, inline=False)
-
-    embed.set_thumbnail(url="attachment://cgcg.png")
-    await ctx.send(embeds=[embed], files=[interactions.File(file=open(get_logo_url(), 'rb'), file_name="cgcg.png")], ephemeral = True)
\ No newline at end of file
+    # Mod roles are per server, a DM only gets the perks. The roster is built from the member
+    # cache, which is filled on first use.
+    if ctx.guild_id:
+        if not ctx.guild.chunked.is_set():
+            await ctx.defer(ephemeral=True)
+            await ensure_members(ctx.guild)
+        fields = get_bank(ctx.guild_id).roster_index.get(ctx.guild).fields()
+        if not fields:
+            embed.add_field(name="No Mod Roles", value="No mod roles have been assigned yet.", inline=False)
+        else:
+            for name, value in fields:
+                embed.add_field(name=name, value=value, inline=False)
+
+    embed.set_thumbnail(url=get_logo_embed_url())
+    await send_with_logo(ctx, [embed], ephemeral=True)
\ No newline at end of file
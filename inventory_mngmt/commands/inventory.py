@@ -1,22 +1,64 @@
+import re
+import csv
+import io
+import aiohttp
 import interactions
 import logging
-from collections import Counter
-from config import user_inventories, get_user_logger, get_bot_logger, get_logo_url, save_inventories, has_permission, get_role_mentions
+from locks import user_locks
+from scheduler import boost_duration
+from metrics import instrumented, metrics
+from announcements import announcer
+from pipeline import pipeline
+from item_catalog import item_catalog, complete_holdings, RANK_OFFICIAL
+from config import get_bank, command_bank, role_members, get_user_logger, get_bot_logger, get_logo_embed_url, send_with_logo
 
-# Define the valid items
+# Define the valid items, suggested first by the item autocomplete
 VALID_ITEMS = ["3h Mill", "3h Industry", "Half Cut trees"]
+item_catalog.update(VALID_ITEMS, rank=RANK_OFFICIAL)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# Helper function to make announcements
+# Helper function to make announcements, batched with others in the same channel
 async def announce_change(ctx, description):
-    embed = interactions.Embed(
-        title="Inventory Update",
-        description=description,
-        color=0xffa500
+    await announcer.announce(ctx, description, title="Inventory Update")
+
+# Option on commands that change inventories, lets a moderator retry without applying a change twice
+def idempotency_option():
+    return interactions.SlashCommandOption(
+        name="idempotency_key",
+        description="Any text, repeating this command with the same key within a day changes nothing",
+        type=interactions.OptionType.STRING,
+        required=False,
+        max_length=100
     )
-    await ctx.send(embeds=[embed])
+
+# Keys a change is deduplicated on: the interaction itself, plus the caller's key if they gave one
+def request_keys(ctx, command, idempotency_key=None):
+    keys = [f"interaction:{ctx.id}"]
+    if idempotency_key:
+        keys.append(f"key:{ctx.author.id}:{command}:{idempotency_key}")
+    return keys
+
+# Stop a command that has already been applied, returns True if it was a duplicate.
+# A redelivered interaction was answered the first time, a retry with the same key is told nothing changed.
+# Call it in the same step as the change, with no await in between, so two copies can't both get through.
+async def skip_duplicate(ctx, bank, keys, command):
+    duplicate = bank.find_processed(keys)
+    if duplicate is None:
+        return False
+    metrics.increment("duplicate_commands_total", command=command)
+    if not duplicate.startswith("interaction:"):
+        await ctx.send("This was already done, nothing was changed.", ephemeral=True)
+    return True
+
+# Check the caller is an administrator or moderator, answering them if they aren't
+async def require_moderator(ctx, bank):
+    member = ctx.guild.get_member(ctx.author.id)
+    if not member or not bank.is_moderator(member):
+        await ctx.send("You are missing the necessary permissions to run this command.", ephemeral=True)
+        return False
+    return True
 
 # Command to show inventory
 @interactions.slash_command(
@@ -31,29 +73,29 @@ async def announce_change(ctx, description):
         )
     ]
 )
+@instrumented
 async def bankinv(ctx: interactions.ComponentContext, user: interactions.User = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
     try:
         logging.info(f"Received /bankinv command from user: {ctx.author.display_name}")
 
         user = user or ctx.author  # Default to the command invoker if no user is specified
         user_id = str(user.id)
-        inventory = user_inventories.get(user_id, [])
+        inventory = bank.get_inventory(user_id)
 
-        # Aggregate items and their counts
-        inventory_counter = Counter(inventory)
-        description = "\n".join([f"{i+1}. {item} x {count}" for i, (item, count) in enumerate(inventory_counter.items())]) if inventory else 'No items found.'
+        description = "\n".join([f"{i+1}. {item} x {count}" for i, (item, count) in enumerate(inventory.items())]) if inventory else 'No items found.'
         
         embed = interactions.Embed(
             title=f"{user.display_name}'s Inventory",
             description=description,
             color=0x0000ff
         )
-        embed.set_thumbnail(url="attachment://cgcg.png")
+        embed.set_thumbnail(url=get_logo_embed_url())
         logging.info(f"Sending inventory for user: {user.display_name}")
 
-        # Correct usage of interactions.File
-        logo_file = interactions.File(get_logo_url(), file_name="cgcg.png")
-        await ctx.send(embeds=[embed], files=[logo_file], ephemeral=False)
+        await send_with_logo(ctx, [embed], ephemeral=False)
     except Exception as e:
         logging.error(f"Error in /bankinv command: {str(e)}")
         await ctx.send(f"Error: {str(e)}", ephemeral=True)
@@ -71,8 +113,9 @@ async def bankinv(ctx: interactions.ComponentContext, user: interactions.User =
         ),
         interactions.SlashCommandOption(
             name="item",
-            description="Item to add (Suggestions: 3h Mill, 3h Industry, Half Cut trees)",
+            description="Item to add",
             type=interactions.OptionType.STRING,
+            autocomplete=True,
             required=True
         ),
         interactions.SlashCommandOption(
@@ -80,36 +123,45 @@ async def bankinv(ctx: interactions.ComponentContext, user: interactions.User =
             description="Quantity of items to add",
             type=interactions.OptionType.INTEGER,
             required=True
-        )
+        ),
+        idempotency_option()
     ]
 )
-async def bankadd(ctx: interactions.ComponentContext, user: interactions.User, item: str, quantity: int):
-    if not has_permission(ctx, "bankadd"):
+@instrumented
+async def bankadd(ctx: interactions.ComponentContext, user: interactions.User, item: str, quantity: int, idempotency_key: str = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    if not bank.has_permission(ctx, "bankadd"):
         await ctx.send("You don't have permission to use this command.", ephemeral=True)
         return
 
     try:
-        user_id = str(user.id)
-        if user_id not in user_inventories:
-            user_inventories[user_id] = []
-        user_inventories[user_id].extend([item] * quantity)
-        save_inventories()
+        keys = request_keys(ctx, "bankadd", idempotency_key)
+        async with user_locks.hold(user.id):
+            if await skip_duplicate(ctx, bank, keys, "bankadd"):
+                return
+            user_id = str(user.id)
+            bank.add_item(user_id, item, quantity)
+            bank.save_inventories(keys)
+            bank.ledger.record("add", ctx.author.id, user_id, item, quantity)
 
-        logger = get_user_logger(user_id)
-        bot_logger = get_bot_logger(ctx.author.id)
-        logger.info(f'{ctx.author.display_name} added {quantity}x {item}.')
-        bot_logger.info(f'{ctx.author.display_name} added {quantity}x {item} to {user.display_name}.')
+        def write_logs():
+            get_user_logger(user_id).info(f'{ctx.author.display_name} added {quantity}x {item}.')
+            get_bot_logger(ctx.author.id).info(f'{ctx.author.display_name} added {quantity}x {item} to {user.display_name}.')
 
         embed = interactions.Embed(
             title="Item Added",
             description=f'{ctx.author.display_name} added {quantity}x {item} to {user.display_name}\'s inventory.',
             color=0x00ff00
         )
-        embed.set_thumbnail(url="attachment://cgcg.png")
-        await ctx.send(embeds=[embed], files=[interactions.File(get_logo_url(), file_name="cgcg.png")], ephemeral=True)
-        
-        # Announce the change
-        await announce_change(ctx, f"{ctx.author.display_name} added {quantity}x {item} to {user.display_name}'s inventory.")
+        embed.set_thumbnail(url=get_logo_embed_url())
+        # Answer now, then write the activity logs and announce the change
+        await pipeline.finish(
+            ctx, "bankadd", write_logs,
+            lambda: announce_change(ctx, f"{ctx.author.display_name} added {quantity}x {item} to {user.display_name}'s inventory."),
+            embeds=[embed]
+        )
     except Exception as e:
         await ctx.send(f"Error: {str(e)}", ephemeral=True)
 
@@ -126,8 +178,9 @@ async def bankadd(ctx: interactions.ComponentContext, user: interactions.User, i
         ),
         interactions.SlashCommandOption(
             name="item",
-            description="Item to remove (Suggestions: 3h Mill, 3h Industry, Half Cut trees)",
+            description="Item to remove",
             type=interactions.OptionType.STRING,
+            autocomplete=True,
             required=True
         ),
         interactions.SlashCommandOption(
@@ -135,38 +188,49 @@ async def bankadd(ctx: interactions.ComponentContext, user: interactions.User, i
             description="Quantity of items to remove",
             type=interactions.OptionType.INTEGER,
             required=True
-        )
+        ),
+        idempotency_option()
     ]
 )
-async def bankremove(ctx: interactions.ComponentContext, user: interactions.User, item: str, quantity: int):
-    if not has_permission(ctx, "bankremove"):
+@instrumented
+async def bankremove(ctx: interactions.ComponentContext, user: interactions.User, item: str, quantity: int, idempotency_key: str = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    if not bank.has_permission(ctx, "bankremove"):
         await ctx.send("You don't have permission to use this command.", ephemeral=True)
         return
 
     try:
-        user_id = str(user.id)
-        if user_id in user_inventories and user_inventories[user_id].count(item) >= quantity:
-            for _ in range(quantity):
-                user_inventories[user_id].remove(item)
-            save_inventories()
-
-            logger = get_user_logger(user_id)
-            bot_logger = get_bot_logger(ctx.author.id)
-            logger.info(f'{ctx.author.display_name} removed {quantity}x {item}.')
-            bot_logger.info(f'{ctx.author.display_name} removed {quantity}x {item} from {user.display_name}.')
-
-            embed = interactions.Embed(
-                title="Item Removed",
-                description=f'{ctx.author.display_name} removed {quantity}x {item} from {user.display_name}\'s inventory.',
-                color=0xff0000
-            )
-            embed.set_thumbnail(url="attachment://cgcg.png")
-            await ctx.send(embeds=[embed], files=[interactions.File(get_logo_url(), file_name="cgcg.png")], ephemeral=True)
-            
-            # Announce the change
-            await announce_change(ctx, f"{ctx.author.display_name} removed {quantity}x {item} from {user.display_name}'s inventory.")
-        else:
+        keys = request_keys(ctx, "bankremove", idempotency_key)
+        async with user_locks.hold(user.id):
+            if await skip_duplicate(ctx, bank, keys, "bankremove"):
+                return
+            user_id = str(user.id)
+            removed = bank.remove_item(user_id, item, quantity)
+            if removed:
+                bank.save_inventories(keys)
+                bank.ledger.record("remove", ctx.author.id, user_id, item, quantity)
+        if not removed:
             await ctx.send(f'{user.display_name} does not have {quantity}x {item}.', ephemeral=True)
+            return
+
+        def write_logs():
+            get_user_logger(user_id).info(f'{ctx.author.display_name} removed {quantity}x {item}.')
+            get_bot_logger(ctx.author.id).info(f'{ctx.author.display_name} removed {quantity}x {item} from {user.display_name}.')
+
+        embed = interactions.Embed(
+            title="Item Removed",
+            description=f'{ctx.author.display_name} removed {quantity}x {item} from {user.display_name}\'s inventory.',
+            color=0xff0000
+        )
+        embed.set_thumbnail(url=get_logo_embed_url())
+        # Answer now, then write the activity logs and announce the change
+        await pipeline.finish(
+            ctx, "bankremove", write_logs,
+            lambda: announce_change(ctx, f"{ctx.author.display_name} removed {quantity}x {item} from {user.display_name}'s inventory."),
+            embeds=[embed]
+        )
     except Exception as e:
         await ctx.send(f"Error: {str(e)}", ephemeral=True)
 
@@ -177,8 +241,9 @@ async def bankremove(ctx: interactions.ComponentContext, user: interactions.User
     options=[
         interactions.SlashCommandOption(
             name="item",
-            description="Item to trade (Suggestions: 3h Mill, 3h Industry, Half Cut trees)",
+            description="Item to trade",
             type=interactions.OptionType.STRING,
+            autocomplete=True,
             required=True
         ),
         interactions.SlashCommandOption(
@@ -198,41 +263,48 @@ async def bankremove(ctx: interactions.ComponentContext, user: interactions.User
             description="User to trade to",
             type=interactions.OptionType.USER,
             required=True
-        )
+        ),
+        idempotency_option()
     ]
 )
-async def banktrade(ctx: interactions.ComponentContext, item: str, quantity: int, from_user: interactions.User, to_user: interactions.User):
+@instrumented
+async def banktrade(ctx: interactions.ComponentContext, item: str, quantity: int, from_user: interactions.User, to_user: interactions.User, idempotency_key: str = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
     try:
-        from_user_id = str(from_user.id)
-        to_user_id = str(to_user.id)
-
-        if from_user_id in user_inventories and user_inventories[from_user_id].count(item) >= quantity:
-            for _ in range(quantity):
-                user_inventories[from_user_id].remove(item)
-            if to_user_id not in user_inventories:
-                user_inventories[to_user_id] = []
-            user_inventories[to_user_id].extend([item] * quantity)
-            save_inventories()
-
-            from_logger = get_user_logger(from_user_id)
-            to_logger = get_user_logger(to_user_id)
-            bot_logger = get_bot_logger(ctx.author.id)
-            from_logger.info(f'{ctx.author.display_name} traded {quantity}x {item} to {to_user.display_name}.')
-            to_logger.info(f'{ctx.author.display_name} received {quantity}x {item} from {from_user.display_name}.')
-            bot_logger.info(f'{ctx.author.display_name} traded {quantity}x {item} from {from_user.display_name} to {to_user.display_name}.')
-
-            embed = interactions.Embed(
-                title="Item Traded",
-                description=f'{ctx.author.display_name} traded {quantity}x {item} from {from_user.display_name} to {to_user.display_name}. How generous!',
-                color=0x800080
-            )
-            embed.set_thumbnail(url="attachment://cgcg.png")
-            await ctx.send(embeds=[embed], files=[interactions.File(get_logo_url(), file_name="cgcg.png")], ephemeral=True)
-
-            # Announce the change
-            await announce_change(ctx, f"{ctx.author.display_name} traded {quantity}x {item} from {from_user.display_name} to {to_user.display_name}.")
-        else:
+        keys = request_keys(ctx, "banktrade", idempotency_key)
+        async with user_locks.hold(from_user.id, to_user.id):
+            if await skip_duplicate(ctx, bank, keys, "banktrade"):
+                return
+            from_user_id = str(from_user.id)
+            to_user_id = str(to_user.id)
+            traded = bank.transfer_item(from_user_id, to_user_id, item, quantity)
+            if traded:
+                bank.save_inventories(keys)
+                bank.ledger.record("trade_out", ctx.author.id, from_user_id, item, quantity, counterparty=to_user_id)
+                bank.ledger.record("trade_in", ctx.author.id, to_user_id, item, quantity, counterparty=from_user_id)
+        if not traded:
             await ctx.send(f'{item} not found in {from_user.display_name}\'s inventory or insufficient quantity.', ephemeral=True)
+            return
+
+        def write_logs():
+            get_user_logger(from_user_id).info(f'{ctx.author.display_name} traded {quantity}x {item} to {to_user.display_name}.')
+            get_user_logger(to_user_id).info(f'{ctx.author.display_name} received {quantity}x {item} from {from_user.display_name}.')
+            get_bot_logger(ctx.author.id).info(f'{ctx.author.display_name} traded {quantity}x {item} from {from_user.display_name} to {to_user.display_name}.')
+
+        embed = interactions.Embed(
+            title="Item Traded",
+            description=f'{ctx.author.display_name} traded {quantity}x {item} from {from_user.display_name} to {to_user.display_name}. How generous!',
+            color=0x800080
+        )
+        embed.set_thumbnail(url=get_logo_embed_url())
+        # Answer now, then write the activity logs and announce the change
+        await pipeline.finish(
+            ctx, "banktrade", write_logs,
+            lambda: announce_change(ctx, f"{ctx.author.display_name} traded {quantity}x {item} from {from_user.display_name} to {to_user.display_name}."),
+            embeds=[embed]
+        )
     except Exception as e:
         await ctx.send(f"Error: {str(e)}", ephemeral=True)
 
@@ -243,8 +315,9 @@ async def banktrade(ctx: interactions.ComponentContext, item: str, quantity: int
     options=[
         interactions.SlashCommandOption(
             name="item",
-            description="Item to use (Suggestions: 3h Mill, 3h Industry, Half Cut trees)",
+            description="Item to use",
             type=interactions.OptionType.STRING,
+            autocomplete=True,
             required=True
         ),
         interactions.SlashCommandOption(
@@ -252,33 +325,327 @@ async def banktrade(ctx: interactions.ComponentContext, item: str, quantity: int
             description="Quantity of items to use",
             type=interactions.OptionType.INTEGER,
             required=True
+        ),
+        idempotency_option()
+    ]
+)
+@instrumented
+async def bankuse(ctx: interactions.ComponentContext, item: str, quantity: int, idempotency_key: str = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    try:
+        keys = request_keys(ctx, "bankuse", idempotency_key)
+        async with user_locks.hold(ctx.author.id):
+            if await skip_duplicate(ctx, bank, keys, "bankuse"):
+                return
+            user_id = str(ctx.author.id)
+            used = bank.remove_item(user_id, item, quantity)
+            if used:
+                bank.save_inventories(keys)
+                # Boosts run for their duration per unit used, on top of any time left from earlier uses
+                duration = boost_duration(item)
+                expires = bank.timers.activate(user_id, item, duration * quantity) if duration else None
+                bank.ledger.record("use", ctx.author.id, user_id, item, quantity, **({"expires": expires} if expires else {}))
+        if not used:
+            await ctx.send(f'You do not have {quantity}x {item}.', ephemeral=True)
+            return
+
+        def write_logs():
+            get_user_logger(user_id).info(f'{ctx.author.display_name} used {quantity}x {item}.')
+            get_bot_logger(ctx.author.id).info(f'{ctx.author.display_name} used {quantity}x {item}.')
+
+        description = f'{ctx.author.display_name} used {quantity}x {item} from their inventory.'
+        if expires:
+            description += f'\nThe boost runs until <t:{int(expires)}:f> (<t:{int(expires)}:R>).'
+        embed = interactions.Embed(
+            title="Item Used",
+            description=description,
+            color=0x00ff00
+        )
+        embed.set_thumbnail(url=get_logo_embed_url())
+        # Answer now, then write the activity logs and announce the change
+        await pipeline.finish(
+            ctx, "bankuse", write_logs,
+            lambda: announce_change(ctx, f"{ctx.author.display_name} used {quantity}x {item} from their inventory."),
+            embeds=[embed]
+        )
+    except Exception as e:
+        await ctx.send(f"Error: {str(e)}", ephemeral=True)
+
+# Largest CSV accepted by /bankbulkadd
+MAX_BULK_ROWS = 2000
+# Lines of the summary announcement before it is cut short
+BULK_SUMMARY_LINES = 20
+
+# Parse (user, item, quantity) rows from an uploaded CSV, users may be IDs or mentions.
+# Returns (grants, errors) where errors describe the rows that could not be read.
+def parse_bulk_csv(text):
+    grants = []
+    errors = []
+    for line_number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not "".join(row).strip():
+            continue
+        if len(row) != 3:
+            errors.append(f"Line {line_number}: expected user, item, quantity")
+            continue
+        user, item, quantity = (value.strip() for value in row)
+        user_match = re.fullmatch(r"<@!?(\d+)>|(\d+)", user)
+        if not quantity.lstrip("-").isdigit():
+            if line_number == 1:
+                continue  # Header row
+            errors.append(f"Line {line_number}: quantity must be a whole number")
+            continue
+        if not user_match:
+            errors.append(f"Line {line_number}: '{user}' is not a user ID or mention")
+            continue
+        if not item:
+            errors.append(f"Line {line_number}: item is empty")
+            continue
+        if int(quantity) <= 0:
+            errors.append(f"Line {line_number}: quantity must be a positive number")
+            continue
+        grants.append((user_match.group(1) or user_match.group(2), item, int(quantity)))
+    if len(grants) > MAX_BULK_ROWS:
+        errors.append(f"Too many rows, the limit is {MAX_BULK_ROWS}")
+    return grants, errors
+
+# Command to add items to many users at once, e.g. CG Pass payouts (admins and moderators only)
+@interactions.slash_command(
+    name="bankbulkadd",
+    description="Add items to everyone with a role, or to each user listed in a CSV file.",
+    options=[
+        interactions.SlashCommandOption(
+            name="role",
+            description="Give the item to every member with this role",
+            type=interactions.OptionType.ROLE,
+            required=False
+        ),
+        interactions.SlashCommandOption(
+            name="item",
+            description="Item to add when using a role",
+            type=interactions.OptionType.STRING,
+            autocomplete=True,
+            required=False
+        ),
+        interactions.SlashCommandOption(
+            name="quantity",
+            description="Quantity to add to each member when using a role",
+            type=interactions.OptionType.INTEGER,
+            required=False
+        ),
+        interactions.SlashCommandOption(
+            name="file",
+            description="CSV with one user, item, quantity row per grant",
+            type=interactions.OptionType.ATTACHMENT,
+            required=False
+        ),
+        idempotency_option()
+    ]
+)
+@instrumented
+async def bankbulkadd(ctx: interactions.ComponentContext, role: interactions.Role = None, item: str = None, quantity: int = None, file: interactions.Attachment = None, idempotency_key: str = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    # Paying out to a whole role or file is for moderators only
+    if not await require_moderator(ctx, bank):
+        return
+
+    keys = request_keys(ctx, "bankbulkadd", idempotency_key)
+    if await skip_duplicate(ctx, bank, keys, "bankbulkadd"):
+        return
+
+    # Downloading the CSV and applying a large batch can take longer than the initial response window
+    await ctx.defer(ephemeral=True)
+    try:
+        if file is not None:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(file.url) as response:
+                    response.raise_for_status()
+                    text = await response.text()
+            grants, errors = parse_bulk_csv(text)
+            if errors:
+                await ctx.send("Nothing was added, fix these rows and try again:\n" + "\n".join(errors[:20]), ephemeral=True)
+                return
+        elif role is not None and item and quantity:
+            grants = [(str(member.id), item, quantity) for member in await role_members(role)]
+        else:
+            await ctx.send("Give either a role with an item and quantity, or a CSV file.", ephemeral=True)
+            return
+        if not grants:
+            await ctx.send("There is nobody to give items to.", ephemeral=True)
+            return
+
+        user_ids = {user_id for user_id, _, _ in grants}
+        async with user_locks.hold(*user_ids):
+            # Checked again in case a copy was applied while the CSV was downloading
+            if await skip_duplicate(ctx, bank, keys, "bankbulkadd"):
+                return
+            # Every row lands in one journal record / transaction and one flush
+            bank.add_items(grants)
+            bank.save_inventories(keys)
+            for user_id, granted_item, granted_quantity in grants:
+                bank.ledger.record("add", ctx.author.id, user_id, granted_item, granted_quantity, bulk=True)
+
+        def write_logs():
+            for user_id, granted_item, granted_quantity in grants:
+                get_user_logger(user_id).info(f'{ctx.author.display_name} added {granted_quantity}x {granted_item}.')
+            get_bot_logger(ctx.author.id).info(f'{ctx.author.display_name} bulk added {len(grants)} grants to {len(user_ids)} users.')
+
+        lines = [f"<@{user_id}>: {granted_quantity}x {granted_item}" for user_id, granted_item, granted_quantity in grants]
+        if len(lines) > BULK_SUMMARY_LINES:
+            lines = lines[:BULK_SUMMARY_LINES] + [f"...and {len(lines) - BULK_SUMMARY_LINES} more"]
+        embed = interactions.Embed(
+            title="Items Added",
+            description=f'{ctx.author.display_name} added items to {len(user_ids)} users.\n\n' + "\n".join(lines),
+            color=0x00ff00
+        )
+        embed.set_thumbnail(url=get_logo_embed_url())
+        # Answer now, then write the activity logs and post one announcement for the whole batch
+        await pipeline.finish(
+            ctx, "bankbulkadd", write_logs,
+            lambda: announce_change(ctx, f"{ctx.author.display_name} added items to {len(user_ids)} users:\n" + "\n".join(lines)),
+            embeds=[embed]
+        )
+    except Exception as e:
+        await ctx.send(f"Error: {str(e)}", ephemeral=True)
+
+# Command to show who holds the most of an item
+@interactions.slash_command(
+    name="bankleaderboard",
+    description="See who holds the most of an item.",
+    options=[
+        interactions.SlashCommandOption(
+            name="item",
+            description="Item to rank holders of",
+            type=interactions.OptionType.STRING,
+            autocomplete=True,
+            required=True
+        ),
+        interactions.SlashCommandOption(
+            name="limit",
+            description="How many holders to show (default 10)",
+            type=interactions.OptionType.INTEGER,
+            required=False,
+            min_value=1,
+            max_value=25
         )
     ]
 )
-async def bankuse(ctx: interactions.ComponentContext, item: str, quantity: int):
+@instrumented
+async def bankleaderboard(ctx: interactions.ComponentContext, item: str, limit: int = 10):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
     try:
-        user_id = str(ctx.author.id)
-        if user_id in user_inventories and user_inventories[user_id].count(item) >= quantity:
-            for _ in range(quantity):
-                user_inventories[user_id].remove(item)
-            save_inventories()
-
-            logger = get_user_logger(user_id)
-            bot_logger = get_bot_logger(ctx.author.id)
-            logger.info(f'{ctx.author.display_name} used {quantity}x {item}.')
-            bot_logger.info(f'{ctx.author.display_name} used {quantity}x {item}.')
-
-            embed = interactions.Embed(
-                title="Item Used",
-                description=f'{ctx.author.display_name} used {quantity}x {item} from their inventory.',
-                color=0x00ff00
-            )
-            embed.set_thumbnail(url="attachment://cgcg.png")
-            await ctx.send(embeds=[embed], files=[interactions.File(get_logo_url(), file_name="cgcg.png")], ephemeral=True)
-
-            # Announce the change
-            await announce_change(ctx, f"{ctx.author.display_name} used {quantity}x {item} from their inventory.")
+        if not bank.item_index.built:
+            await ctx.defer()
+            await bank.item_index.wait_built()
+        top_holders = bank.item_index.top(item, limit)
+        description = "\n".join([f"{i+1}. <@{user_id}> x {quantity}" for i, (user_id, quantity) in enumerate(top_holders)]) if top_holders else f'Nobody holds any {item}.'
+        embed = interactions.Embed(
+            title=f"Top {item} Holders",
+            description=description,
+            color=0x0000ff
+        )
+        embed.set_thumbnail(url=get_logo_embed_url())
+        await send_with_logo(ctx, [embed], ephemeral=False)
+    except Exception as e:
+        await ctx.send(f"Error: {str(e)}", ephemeral=True)
+
+# Command to show how much of each item is in circulation
+@interactions.slash_command(
+    name="banksupply",
+    description="See how much of each item is held across the bank.",
+    options=[
+        interactions.SlashCommandOption(
+            name="item",
+            description="Only show this item",
+            type=interactions.OptionType.STRING,
+            autocomplete=True,
+            required=False
+        )
+    ]
+)
+@instrumented
+async def banksupply(ctx: interactions.ComponentContext, item: str = None):
+    bank = await command_bank(ctx)
+    if bank is None:
+        return
+    try:
+        if not bank.item_index.built:
+            await ctx.defer()
+            await bank.item_index.wait_built()
+        if item:
+            totals = [(item, bank.item_index.totals().get(item, 0))]
         else:
-            await ctx.send(f'You do not have {quantity}x {item}.', ephemeral=True)
+            totals = sorted(bank.item_index.totals().items(), key=lambda entry: entry[1], reverse=True)
+        description = "\n".join([f"{name} x {total} ({bank.item_index.holder_count(name)} holders)" for name, total in totals]) if totals else 'The bank is empty.'
+        embed = interactions.Embed(
+            title="Bank Supply",
+            description=description[:4000],
+            color=0x0000ff
+        )
+        embed.set_thumbnail(url=get_logo_embed_url())
+        await send_with_logo(ctx, [embed], ephemeral=False)
     except Exception as e:
-        await ctx.send(f"Error: {str(e)}", ephemeral=True)
\ No newline at end of file
+        await ctx.send(f"Error: {str(e)}", ephemeral=True)
+
+# Discord limits autocomplete choice names and values to 100 characters
+MAX_CHOICE_LENGTH = 100
+
+# Autocomplete choices for any known item
+def catalog_choices(text):
+    return [{"name": item, "value": item} for item in item_catalog.complete(text) if len(item) <= MAX_CHOICE_LENGTH]
+
+# Autocomplete choices for the items a user holds in the guild's bank, with quantities,
+# or any item if the user isn't picked yet
+def holding_choices(guild_id, user_id, text):
+    if not user_id or guild_id is None:
+        return catalog_choices(text)
+    bank = get_bank(guild_id)
+    return [
+        {"name": f"{item} (x{quantity})"[:MAX_CHOICE_LENGTH], "value": item}
+        for item, quantity in complete_holdings(bank.get_inventory(user_id), text) if len(item) <= MAX_CHOICE_LENGTH
+    ]
+
+# ID of a user option filled in before the focused one, None if it is still empty
+def option_user_id(ctx, name):
+    value = ctx.kwargs.get(name)
+    return str(getattr(value, "id", value)) if value else None
+
+@bankadd.autocomplete("item")
+@instrumented
+async def bankadd_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=catalog_choices(ctx.input_text))
+
+@bankremove.autocomplete("item")
+@instrumented
+async def bankremove_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=holding_choices(ctx.guild_id, option_user_id(ctx, "user"), ctx.input_text))
+
+@banktrade.autocomplete("item")
+@instrumented
+async def banktrade_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=holding_choices(ctx.guild_id, option_user_id(ctx, "from_user"), ctx.input_text))
+
+@bankuse.autocomplete("item")
+@instrumented
+async def bankuse_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=holding_choices(ctx.guild_id, str(ctx.author.id), ctx.input_text))
+
+@bankbulkadd.autocomplete("item")
+@instrumented
+async def bankbulkadd_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=catalog_choices(ctx.input_text))
+
+@bankleaderboard.autocomplete("item")
+@instrumented
+async def bankleaderboard_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=catalog_choices(ctx.input_text))
+
+@banksupply.autocomplete("item")
+@instrumented
+async def banksupply_item_autocomplete(ctx: interactions.AutocompleteContext):
+    await ctx.send(choices=catalog_choices(ctx.input_text))
@@ -1,90 +1,213 @@
+import io
 import os
-import json
-import logging
+import time
 
 import interactions
 
-# Initialize shared data
-user_inventories = {}
-role_data = {}
+import log_sink
+from persistence import worker, write_text_atomic
+from metrics import metrics
+from scheduler import scheduler
+from guild_bank import GuildBank, ROLES_FILE, INVENTORY_SNAPSHOT, INVENTORY_JOURNAL, SQLITE_FILE, LEDGER_FILE, LEDGER_INDEX_FILE
+from snapshot import list_snapshots
+
+# Sharding: run shard_count processes, each with its own shard_id from 0 to shard_count - 1.
+# A process connects as that gateway shard, so Discord only sends it the events and
+# interactions of the guilds it owns, and it only ever opens those guilds' banks.
+SHARD_ID = int(os.getenv("shard_id", 0))
+SHARD_COUNT = int(os.getenv("shard_count", 1))
 
 # Ensure necessary directories exist
-os.makedirs('logs', exist_ok=True)
-os.makedirs('data', exist_ok=True)
+DATA_DIR = 'data'
+# Activity logs, every shard rotates and archives its own. Logs are per user, not per guild, so
+# they aren't moved when sharding is switched on: logs written before stay in logs/ and are read
+# with log_archive.py, /banklogs only shows what the shard has written since.
+LOGS_DIR = 'logs' if SHARD_COUNT == 1 else os.path.join('logs', f'shard{SHARD_ID}')
+os.makedirs(LOGS_DIR, exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
 
 # Path to the logo image
 logo_path = os.path.join(os.getcwd(), 'assets', 'cgcg.png')
+LOGO_FILE_NAME = 'cgcg.png'
+LOGO_ATTACHMENT_URL = f"attachment://{LOGO_FILE_NAME}"
+# Discord attachment URLs are signed and expire after about a day, upload again well before that
+LOGO_URL_TTL = 12 * 60 * 60
+
+# A permanently hosted logo can be configured, otherwise the first upload's CDN URL is reused
+_configured_logo_url = os.getenv("logo_url")
+_uploaded_logo_url = None
+_uploaded_logo_at = 0
+_logo_bytes = None
 
-# Function to get the logo URL
+# Function to get the logo URL, None until the logo has been uploaded once
 def get_logo_url():
-    return logo_path
+    if _configured_logo_url:
+        return _configured_logo_url
+    if _uploaded_logo_url and time.time() - _uploaded_logo_at < LOGO_URL_TTL:
+        return _uploaded_logo_url
+    return None
+
+# URL to use for embed thumbnails and icons
+def get_logo_embed_url():
+    return get_logo_url() or LOGO_ATTACHMENT_URL
+
+# Files to attach alongside logo embeds: the logo if any of them was built while it wasn't hosted.
+# This follows the embeds rather than the current URL, so a copy hosted by another command in the
+# meantime never leaves them pointing at a file that wasn't sent.
+def get_logo_files(embeds):
+    global _logo_bytes
+    if not any(_uses_logo_attachment(embed) for embed in embeds or ()):
+        return []
+    if _logo_bytes is None:
+        with open(logo_path, 'rb') as file:
+            _logo_bytes = file.read()
+    return [interactions.File(io.BytesIO(_logo_bytes), file_name=LOGO_FILE_NAME)]
+
+def _uses_logo_attachment(embed):
+    icons = (embed.thumbnail, embed.author, embed.footer)
+    return any(LOGO_ATTACHMENT_URL in (getattr(icon, "url", None), getattr(icon, "icon_url", None)) for icon in icons)
+
+# Remember the CDN URL of a logo we just uploaded
+def remember_logo_url(message):
+    global _uploaded_logo_url, _uploaded_logo_at
+    for attachment in getattr(message, "attachments", None) or []:
+        if attachment.filename == LOGO_FILE_NAME:
+            _uploaded_logo_url = attachment.url
+            _uploaded_logo_at = time.time()
+            return
+
+# Send embeds with the bank logo, uploading it only when they were built without a hosted copy.
+# `files` are the logo files when they were already decided by get_logo_files().
+async def send_with_logo(ctx, embeds, files=None, **kwargs):
+    files = get_logo_files(embeds) if files is None else files
+    message = await ctx.send(embeds=embeds, files=files, **kwargs)
+    if files:
+        remember_logo_url(message)
+    return message
+
+# Live activity log of a user, older entries are in its rotated and archived segments
+def user_log_path(user_id):
+    return os.path.join(LOGS_DIR, f'{user_id}.log')
 
 # Function to get logger for a specific user
 def get_user_logger(user_id):
-    logger = logging.getLogger(user_id)
-    if not logger.hasHandlers():
-        handler = logging.FileHandler(f'logs/{user_id}.log')
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
-    return logger
+    return log_sink.get_file_logger(user_log_path(user_id))
 
 # Function to get logger for bot actions by a specific user
 def get_bot_logger(user_id):
-    logger = logging.getLogger(f"bot_{user_id}")
-    if not logger.hasHandlers():
-        handler = logging.FileHandler(f'logs/bot_{user_id}.log')
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
-    return logger
-
-# Load roles from a JSON file
-def load_roles():
-    if os.path.exists('data/roles.json'):
-        with open('data/roles.json', 'r') as file:
-            return json.load(file)
-    return {"permissions": {}, "mod_roles": []}
-
-# Save roles to a JSON file
-def save_roles(roles):
-    with open('data/roles.json', 'w') as file:
-        json.dump(roles, file, indent=4)
-
-# Load inventories from a JSON file
-def load_inventories():
-    if os.path.exists('data/inventories.json'):
-        with open('data/inventories.json', 'r') as file:
-            return json.load(file)
-    return {}
-
-# Save inventories to a JSON file
-def save_inventories():
-    with open('data/inventories.json', 'w') as file:
-        json.dump(user_inventories, file, indent=4)
-
-# Load roles and inventories into memory
-role_data = load_roles()
-user_inventories = load_inventories()
-
-# Check if a user has the necessary permissions
-def has_permission(ctx, command_name):
-    member = ctx.guild.get_member(ctx.author.id)
-    if not member:
-        return False
-    user_permissions = role_data["permissions"].get(str(ctx.author.id), [])
-    if command_name in ["additem", "removeitem"]:
-        return (
-            command_name in user_permissions or
-            any(role.id in role_data["mod_roles"] for role in member.roles) or
-            any(role.name == "🏆 CG Dev" for role in member.roles) or
-            member.has_permission(interactions.Permissions.ADMINISTRATOR)
-        )
-    return True
-
-# Get the role mentions
-def get_role_mentions(guild):
-    mod_roles = [f"<@&{role_id}>" for role_id in role_data["mod_roles"]]
-    return ", ".join(mod_roles) if mod_roles else "@MODERATOR"
+    return log_sink.get_file_logger(os.path.join(LOGS_DIR, f'bot_{user_id}.log'))
+
+# Rotate, compress and archive the activity logs every LOG_MAINTENANCE_INTERVAL seconds
+LOG_MAINTENANCE_INTERVAL = 60 * 60
+
+# Run one log maintenance pass on the persistence thread
+def maintain_logs():
+    worker.schedule("log_archive", lambda: log_sink.maintain(LOGS_DIR))
+
+# Storage backend for every guild's bank: "json" (roles file, inventory snapshot + journal) or "sqlite"
+STORAGE_BACKEND = os.getenv("storage_backend", "json")
+# The single database from before storage was split per guild, moved to the home guild's bank
+SQLITE_PATH = os.getenv("sqlite_path", 'data/bank.db')
+
+# Each guild's bank lives in its own directory under here
+GUILDS_DIR = os.path.join(DATA_DIR, 'guilds')
+# The guild the bank was built for, it takes over the data from before storage was split per guild
+HOME_GUILD_ID = int(os.getenv("home_guild_id", 881509696882757643))
+# Files that used to sit directly in DATA_DIR, next to the binary snapshots
+LEGACY_FILES = [ROLES_FILE, INVENTORY_SNAPSHOT, INVENTORY_JOURNAL, LEDGER_FILE, LEDGER_INDEX_FILE]
+
+# Discord's shard formula, the shard a guild's events are sent to
+def shard_for(guild_id):
+    return (int(guild_id) >> 22) % SHARD_COUNT
+
+def owns_guild(guild_id):
+    return shard_for(guild_id) == SHARD_ID
+
+# Files every shard writes for itself get the shard number, e.g. data/metrics.shard1.prom
+def shard_file(path):
+    if SHARD_COUNT == 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard{SHARD_ID}{extension}"
+
+# Prometheus text file with the runtime metrics, rewritten every METRICS_EXPORT_INTERVAL seconds
+METRICS_FILE = shard_file(os.getenv("metrics_file", 'data/metrics.prom'))
+METRICS_EXPORT_INTERVAL = 15
+
+# Open banks by guild ID
+banks = {}
+
+def guild_directory(guild_id):
+    return os.path.join(GUILDS_DIR, str(int(guild_id)))
+
+# Move the files from before storage was split per guild into the home guild's directory.
+# They are gathered in a staging directory that is renamed into place last, so a crash
+# part way through picks up where it left off on the next start.
+def _migrate_legacy_files(directory):
+    if os.path.exists(directory):
+        return
+    moves = [os.path.join(DATA_DIR, name) for name in LEGACY_FILES]
+    moves += [path for _, path in list_snapshots(DATA_DIR)]
+    moves = [(path, os.path.basename(path)) for path in moves]
+    moves += [(SQLITE_PATH + suffix, SQLITE_FILE + suffix) for suffix in ("", "-wal", "-shm")]
+    moves = [(path, name) for path, name in moves if os.path.exists(path)]
+    staging = directory + '.migrating'
+    if not moves and not os.path.exists(staging):
+        return
+    os.makedirs(staging, exist_ok=True)
+    for path, name in moves:
+        os.replace(path, os.path.join(staging, name))
+    os.replace(staging, directory)
+
+# The bank of a guild this shard owns, opened on first use
+def get_bank(guild_id):
+    if guild_id is None:
+        raise ValueError("The bank can only be used in a server.")
+    guild_id = int(guild_id)
+    bank = banks.get(guild_id)
+    if bank is None:
+        if not owns_guild(guild_id):
+            raise ValueError(f"Guild {guild_id} belongs to shard {shard_for(guild_id)}, this is shard {SHARD_ID}.")
+        directory = guild_directory(guild_id)
+        if guild_id == HOME_GUILD_ID:
+            _migrate_legacy_files(directory)
+        with metrics.timer("bank_open_seconds"):
+            bank = banks[guild_id] = GuildBank(guild_id, directory, STORAGE_BACKEND)
+    return bank
+
+# Fill a guild's member cache. Members aren't fetched at startup so the bot is ready straight
+# away, a guild is fetched the first time something needs all of its members and member events
+# keep it complete after that.
+async def ensure_members(guild):
+    if not guild.chunked.is_set():
+        await guild.gateway_chunk(presences=False)
+
+# Everyone with a role, so a payout never skips members the bot hasn't seen yet
+async def role_members(role):
+    await ensure_members(role.guild)
+    return role.members
+
+# The bank of the guild a command was used in. Commands used in a DM or in a guild of another
+# shard are answered with the reason and get None.
+async def command_bank(ctx):
+    try:
+        return get_bank(ctx.guild_id)
+    except ValueError as e:
+        await ctx.send(f"Error: {str(e)}", ephemeral=True)
+        return None
+
+# A guild's bank if it is already open, for events that only need to update its caches
+def loaded_bank(guild_id):
+    return banks.get(int(guild_id)) if guild_id is not None else None
+
+metrics.gauge("guild_banks_open", lambda: len(banks))
+metrics.gauge("journal_unwritten_records", lambda: sum(bank.unwritten_records() for bank in list(banks.values())))
+metrics.gauge(
+    "inventory_users_loaded",
+    lambda: sum(len(bank.user_inventories.loaded_items()) for bank in list(banks.values()))
+)
+metrics.gauge("scheduled_timers", scheduler.pending)
+
+# Write the current metrics to METRICS_FILE on the persistence thread
+def export_metrics():
+    worker.schedule("metrics", lambda: write_text_atomic(METRICS_FILE, metrics.render()))
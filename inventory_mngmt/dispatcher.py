@@ -0,0 +1,253 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+import aiohttp
+import interactions
+
+# Lower numbers go first. Interaction responses are sent inline by the handlers and only
+# queued work goes through the dispatcher, but it holds back while responses are in flight.
+PRIORITY_RESPONSE = 0
+PRIORITY_ANNOUNCEMENT = 1
+PRIORITY_LOG = 2
+
+# Sends we allow ourselves per route and window, Discord allows about 5 messages per 5 seconds per channel
+ROUTE_LIMIT = 5
+ROUTE_WINDOW = 5.0
+# Attempts per message before it is dropped, with exponential backoff between them
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# Queued messages sent at the same time
+WORKERS = 2
+# Longest queued work waits for in-flight interaction responses before going ahead anyway
+RESPONSE_WAIT = 1.0
+
+class RateLimited(Exception):
+    def __init__(self, retry_after, is_global=False):
+        super().__init__(f"rate limited for {retry_after:.2f}s")
+        self.retry_after = retry_after
+        self.is_global = is_global
+
+# A failure that is worth retrying, e.g. a 5xx or a dropped connection
+class TransientError(Exception):
+    pass
+
+# Sliding window of recent sends on one route, plus any block Discord told us about
+class RouteBucket:
+    def __init__(self, limit=ROUTE_LIMIT, window=ROUTE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.blocked_until = 0.0
+        self._sent = deque()
+
+    # Seconds until the next send on this route is allowed
+    def delay(self, now):
+        while self._sent and self._sent[0] <= now - self.window:
+            self._sent.popleft()
+        wait = self.blocked_until - now
+        if len(self._sent) >= self.limit:
+            wait = max(wait, self._sent[0] + self.window - now)
+        return max(wait, 0.0)
+
+    def record(self, now):
+        self._sent.append(now)
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+class OutboundJob:
+    __slots__ = ("route", "priority", "call", "description", "attempts", "seq")
+
+    def __init__(self, route, priority, call, description, seq):
+        self.route = route
+        self.priority = priority
+        self.call = call
+        self.description = description
+        self.attempts = 0
+        self.seq = seq
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("Retry-After", 1.0))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+# Sends through interactions.py and sorts its errors into rate limits, retryable and final
+class DiscordTransport:
+    async def deliver(self, job):
+        try:
+            return await job.call()
+        except interactions.errors.HTTPException as e:
+            if e.status == 429:
+                raise RateLimited(_retry_after(e)) from e
+            if e.status >= 500:
+                raise TransientError(str(e)) from e
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+            raise TransientError(str(e)) from e
+
+# Stand-in for Discord in tests and benchmarks. It enforces its own per-route limit, can add
+# latency and fail a share of sends, and records what got through before running the call.
+class LocalTransport:
+    def __init__(self, limit=ROUTE_LIMIT, window=ROUTE_WINDOW, latency=0.0, failure_rate=0.0, seed=None):
+        self.limit = limit
+        self.window = window
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.buckets = {}
+        self.delivered = []  # (time, route, priority)
+        self.rate_limited = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+
+    async def deliver(self, job):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        bucket = self.buckets.setdefault(job.route, RouteBucket(self.limit, self.window))
+        now = time.monotonic()
+        wait = bucket.delay(now)
+        if wait > 0:
+            self.rate_limited += 1
+            raise RateLimited(wait)
+        if self._random.random() < self.failure_rate:
+            self.failed += 1
+            raise TransientError("simulated failure")
+        bucket.record(now)
+        self.delivered.append((now, job.route, job.priority))
+        return await job.call()
+
+# Queue for messages nobody is waiting on, such as announcement digests.
+# Messages go out highest priority first, a few at a time. A route that is out of sends,
+# by our own count or because Discord answered 429, is parked until it resets while other
+# routes carry on. Failures are retried with exponential backoff and jitter.
+class OutboundDispatcher:
+    def __init__(self, transport=None, workers=WORKERS, route_limit=ROUTE_LIMIT, route_window=ROUTE_WINDOW,
+                 max_attempts=MAX_ATTEMPTS):
+        self.transport = transport or DiscordTransport()
+        self.worker_count = workers
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.max_attempts = max_attempts
+        self.stats = Counter()
+        self._heap = []
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._global_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._responses = 0
+        self._responses_idle = asyncio.Event()
+        self._responses_idle.set()
+        self._workers = []
+        self._parked = 0
+        self._active = 0
+
+    # Queue a message, `call` is a zero-argument coroutine function that sends it
+    def post(self, route, call, priority=PRIORITY_ANNOUNCEMENT, description="message"):
+        self._push(OutboundJob(route, priority, call, description, next(self._seq)))
+        self._start()
+
+    # Messages queued, parked or being sent
+    def pending(self):
+        return len(self._heap) + self._parked + self._active
+
+    # Wrap the handling of an interaction, queued work waits while any are in flight
+    @asynccontextmanager
+    async def responding(self):
+        self._responses += 1
+        self._responses_idle.clear()
+        try:
+            yield
+        finally:
+            self._responses -= 1
+            if not self._responses:
+                self._responses_idle.set()
+
+    # Wait until everything queued has been sent or given up on
+    async def drain(self, poll=0.05):
+        while self.pending():
+            await asyncio.sleep(poll)
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers.clear()
+
+    def _start(self):
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.get_running_loop().create_task(self._work()))
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.priority, job.seq, job))
+        self._wakeup.set()
+
+    def _park(self, job, delay):
+        self._parked += 1
+
+        def unpark():
+            self._parked -= 1
+            self._push(job)
+        asyncio.get_running_loop().call_later(delay, unpark)
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = RouteBucket(self.route_limit, self.route_window)
+        return bucket
+
+    async def _next_job(self):
+        while not self._heap:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return heapq.heappop(self._heap)[2]
+
+    async def _work(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._responses_idle.wait(), RESPONSE_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            job = await self._next_job()
+            now = time.monotonic()
+            bucket = self._bucket(job.route)
+            delay = max(bucket.delay(now), self._global_until - now)
+            if delay > 0:
+                self._park(job, delay)
+                continue
+            bucket.record(now)
+            self._active += 1
+            try:
+                await self.transport.deliver(job)
+                self.stats["sent"] += 1
+            except RateLimited as e:
+                self.stats["rate_limited"] += 1
+                if e.is_global:
+                    self._global_until = time.monotonic() + e.retry_after
+                else:
+                    bucket.block(time.monotonic() + e.retry_after)
+                self._retry(job, e.retry_after, e)
+            except TransientError as e:
+                backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** job.attempts)
+                self._retry(job, backoff / 2 + random.uniform(0, backoff / 2), e)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logging.error(f"Failed to send {job.description} on {job.route}: {str(e)}")
+            finally:
+                self._active -= 1
+
+    def _retry(self, job, delay, error):
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            self.stats["failed"] += 1
+            logging.error(f"Gave up sending {job.description} on {job.route} after {job.attempts} attempts: {str(error)}")
+            return
+        self.stats["retried"] += 1
+        self._park(job, delay)
+
+dispatcher = OutboundDispatcher()
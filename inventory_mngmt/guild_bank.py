@@ -0,0 +1,346 @@
+import os
+import copy
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+
+from journal import Journal, apply_change
+from idempotency import ProcessedKeys
+from ledger import Ledger
+from scheduler import BankTimers
+from persistence import worker, write_json_atomic
+from metrics import metrics
+from sqlite_storage import SqliteStorage
+from permissions import PermissionResolver
+from roster import RosterIndex
+from aggregates import ItemIndex
+from item_catalog import item_catalog
+from inventory_store import LazyInventories
+from snapshot import SnapshotReader, list_snapshots, snapshot_path, write_snapshot
+
+# Fold the journal into a fresh snapshot once it holds this many records
+JOURNAL_COMPACT_EVERY = 500
+
+# Files a guild's bank keeps in its directory
+ROLES_FILE = 'roles.json'
+# Snapshot of all inventories plus a journal of the changes made since it was written
+INVENTORY_SNAPSHOT = 'inventories.json'
+INVENTORY_JOURNAL = 'inventories.journal'
+SQLITE_FILE = 'bank.db'
+LEDGER_FILE = 'ledger.jsonl'
+LEDGER_INDEX_FILE = 'ledger.idx'
+# Active boosts and recurring grants
+TIMERS_FILE = 'timers.json'
+
+# Convert inventories to the counted item -> quantity format.
+# Older files stored one list entry per unit, e.g. ["3h Mill", "3h Mill", ...]
+def migrate_inventories(raw_inventories):
+    inventories = {}
+    for user_id, holdings in raw_inventories.items():
+        if isinstance(holdings, list):
+            holdings = Counter(holdings)
+        inventories[user_id] = {item: count for item, count in holdings.items() if count > 0}
+    return inventories
+
+# Roles, inventories, ledger, timers and the indexes built on them for one guild.
+# Each guild has its own directory (roles file, snapshot + journal or SQLite database, ledger,
+# timers) and its own persistence tasks, so a burst of changes in one guild only rewrites that
+# guild's files. The tasks still run one after another on the single persistence thread, so a
+# slow write in one guild delays the flush of the others, though never their commands.
+class GuildBank:
+    def __init__(self, guild_id, directory, backend="json"):
+        self.guild_id = int(guild_id)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.roles_file = os.path.join(directory, ROLES_FILE)
+        self.inventory_snapshot = os.path.join(directory, INVENTORY_SNAPSHOT)
+        self.journal = Journal(os.path.join(directory, INVENTORY_JOURNAL))
+        self.sqlite_storage = SqliteStorage(os.path.join(directory, SQLITE_FILE)) if backend == "sqlite" else None
+        # Persistence tasks are keyed per guild so one guild's changes never replace another's pending write
+        self._roles_task = f"roles:{self.guild_id}"
+        self._inventories_task = f"inventories:{self.guild_id}"
+        # Changes made since the last save_inventories() call, written as one journal record
+        self._pending_changes = []
+        # Records and snapshots waiting for the persistence thread, guarded by _write_lock
+        self._unwritten_records = []
+        self._unwritten_snapshot = None
+        # Path of the newest snapshot the persistence thread has written, picked up by the event loop
+        self._written_snapshot_path = None
+        self._write_lock = threading.Lock()
+        self._records_since_snapshot = 0
+        # Commands already applied, so a redelivered interaction or a retry with the same key is skipped
+        self.processed_keys = ProcessedKeys()
+
+        if self.sqlite_storage:
+            self._import_files_into_sqlite()
+        self.role_data = self.load_roles()
+        self.user_inventories = self.load_inventories()
+        self.item_index = ItemIndex()
+        self.item_index.build_in_background(worker, f"item_index:{self.guild_id}", self._index_scan())
+        item_catalog.update(self.user_inventories.item_names())
+        if not self.sqlite_storage and self._records_since_snapshot >= JOURNAL_COMPACT_EVERY:
+            self.compact_inventories()
+        self.permission_resolver = PermissionResolver(self.role_data)
+        self.roster_index = RosterIndex(self.role_data)
+        self.ledger = Ledger(
+            os.path.join(directory, LEDGER_FILE), os.path.join(directory, LEDGER_INDEX_FILE),
+            task=f"ledger:{self.guild_id}"
+        )
+        self.timers = BankTimers(self.guild_id, os.path.join(directory, TIMERS_FILE))
+
+    # Load roles from the configured backend
+    def load_roles(self):
+        if self.sqlite_storage:
+            return self.sqlite_storage.load_roles()
+        return self._load_roles_file()
+
+    def _load_roles_file(self):
+        if os.path.exists(self.roles_file):
+            with open(self.roles_file, 'r') as file:
+                return json.load(file)
+        return {"permissions": {}, "mod_roles": []}
+
+    # Save roles to the configured backend on the persistence thread
+    @metrics.timed("save_seconds", store="roles")
+    def save_roles(self):
+        self.permission_resolver.reload()
+        roles = copy.deepcopy(self.role_data)
+        if self.sqlite_storage:
+            worker.schedule(self._roles_task, lambda: self.sqlite_storage.save_roles(roles))
+        else:
+            worker.schedule(self._roles_task, lambda: write_json_atomic(self.roles_file, roles, indent=4))
+
+    # Load inventories from the configured backend
+    def load_inventories(self):
+        if self.sqlite_storage:
+            self.processed_keys.load(self.sqlite_storage.load_processed_keys(time.time()))
+            return self.sqlite_storage.load_inventories()
+        return self._load_inventory_files()
+
+    # Open the newest binary snapshot and replay the journal on top of it.
+    # Users are read from the snapshot on first access, only the ones touched by the journal are
+    # loaded up front. Older JSON snapshots are loaded in full once and then replaced.
+    def _load_inventory_files(self):
+        snapshots = list_snapshots(self.directory)
+        if snapshots:
+            reader = SnapshotReader(snapshots[-1][1])
+            inventories = LazyInventories(reader)
+            snapshot_seq = reader.seq
+        else:
+            inventories = LazyInventories()
+            snapshot_seq = 0
+            if os.path.exists(self.inventory_snapshot):
+                with open(self.inventory_snapshot, 'r') as file:
+                    snapshot = json.load(file)
+                if "inventories" in snapshot:
+                    snapshot_seq = snapshot.get("seq", 0)
+                    snapshot = snapshot["inventories"]
+                inventories.update(migrate_inventories(snapshot))
+                # Write the first binary snapshot as soon as the bot starts saving
+                self._records_since_snapshot = JOURNAL_COMPACT_EVERY
+        for record in self.journal.replay(snapshot_seq):
+            for user_id, item, delta in record["changes"]:
+                apply_change(inventories, user_id, item, delta)
+            self.processed_keys.load(record.get("keys", ()))
+        return inventories
+
+    # Queue the changes made since the last call as a single journal record, along with the
+    # interaction IDs and idempotency keys of the command that made them.
+    # The record is written by the persistence thread, batched with any others from the same interval.
+    @metrics.timed("save_seconds", store="inventories")
+    def save_inventories(self, keys=()):
+        self._adopt_written_snapshot()
+        processed = self.processed_keys.add(keys) if keys else None
+        if self._pending_changes or processed:
+            record = self.journal.record(list(self._pending_changes), processed)
+            self._pending_changes.clear()
+            with self._write_lock:
+                self._unwritten_records.append(record)
+            self._records_since_snapshot += 1
+        if self._records_since_snapshot >= JOURNAL_COMPACT_EVERY and not self.sqlite_storage:
+            self.compact_inventories()
+        worker.schedule(self._inventories_task, self._flush_inventories)
+
+    # Queue a full snapshot, after which the journal starts over.
+    # Only users in memory are copied here; everyone else is carried over from the current
+    # snapshot file by the persistence thread.
+    def compact_inventories(self):
+        source = self.user_inventories.source
+        snapshot = {
+            "seq": self.journal.seq,
+            "inventories": {user_id: dict(inventory) for user_id, inventory in self.user_inventories.loaded_items()},
+            "source_path": source.path if isinstance(source, SnapshotReader) else None,
+            "deleted": self.user_inventories.deleted_ids()
+        }
+        # The journal starts over after the snapshot, so the keys still live open the new one
+        live_keys = self.processed_keys.items()
+        with self._write_lock:
+            self._unwritten_snapshot = snapshot
+            if live_keys:
+                self._unwritten_records.append(self.journal.record([], live_keys))
+        self._records_since_snapshot = 0
+        worker.schedule(self._inventories_task, self._flush_inventories)
+
+    # Runs on the persistence thread, returns the size of the new snapshot
+    def _write_snapshot(self, snapshot):
+        path = snapshot_path(self.directory, snapshot["seq"])
+        source = SnapshotReader(snapshot["source_path"]) if snapshot["source_path"] else None
+        try:
+            inventories = snapshot["inventories"]
+            skip = inventories.keys() | snapshot["deleted"]
+            carried_over = ((user_id, inventory) for user_id, inventory in source.iter_inventories()
+                            if user_id not in skip) if source else ()
+            size = write_snapshot(path, snapshot["seq"], itertools.chain(inventories.items(), carried_over))
+        finally:
+            if source:
+                source.close()
+        with self._write_lock:
+            self._written_snapshot_path = path
+        # Nothing reads snapshots older than the one this was built from any more
+        source_seq = source.seq if source else snapshot["seq"]
+        for seq, old_path in list_snapshots(self.directory):
+            if seq < source_seq:
+                os.remove(old_path)
+        return size
+
+    # Switch lazy loading over to the newest snapshot, runs on the event loop
+    def _adopt_written_snapshot(self):
+        with self._write_lock:
+            path, self._written_snapshot_path = self._written_snapshot_path, None
+        if path is None or self.sqlite_storage:
+            return
+        previous = self.user_inventories.source
+        self.user_inventories.source = SnapshotReader(path)
+        if previous:
+            previous.close()
+
+    # Runs on the persistence thread, returns the number of bytes written
+    def _flush_inventories(self):
+        with self._write_lock:
+            snapshot, self._unwritten_snapshot = self._unwritten_snapshot, None
+            records = self._unwritten_records[:]
+            self._unwritten_records.clear()
+        try:
+            if self.sqlite_storage:
+                self.sqlite_storage.apply_changes(
+                    [change for record in records for change in record["changes"]],
+                    [key for record in records for key in record.get("keys", ())]
+                )
+                return None
+            written = 0
+            if snapshot:
+                written += self._write_snapshot(snapshot)
+                self.journal.truncate()
+                records = [record for record in records if record["seq"] > snapshot["seq"]]
+            return written + self.journal.write(records)
+        except Exception:
+            # Put everything back so the next flush retries it
+            with self._write_lock:
+                self._unwritten_records[:0] = records
+                if self._unwritten_snapshot is None:
+                    self._unwritten_snapshot = snapshot
+            raise
+
+    # What the item index is built from on the persistence thread: a copy of the users in memory,
+    # taken now on the event loop, and everyone else read from the snapshot or database
+    def _index_scan(self):
+        loaded = [(user_id, dict(inventory)) for user_id, inventory in self.user_inventories.loaded_items()]
+        skip = {user_id for user_id, _ in loaded} | self.user_inventories.deleted_ids()
+        source = self.user_inventories.source
+
+        def scan():
+            yield from loaded
+            if source is None:
+                return
+            # A snapshot is opened again, the loop closes its own reader when it adopts a newer one
+            reader = SnapshotReader(source.path) if isinstance(source, SnapshotReader) else source
+            try:
+                for user_id, inventory in reader.iter_inventories():
+                    if user_id not in skip:
+                        yield user_id, inventory
+            finally:
+                if reader is not source:
+                    reader.close()
+        return scan
+
+    # Copy the JSON files into a new, empty SQLite database
+    def _import_files_into_sqlite(self):
+        if not self.sqlite_storage.is_empty():
+            return
+        if os.path.exists(self.roles_file):
+            self.sqlite_storage.save_roles(self._load_roles_file())
+        if (list_snapshots(self.directory) or os.path.exists(self.inventory_snapshot)
+                or os.path.exists(self.journal.path)):
+            self.sqlite_storage.replace_inventories(self._load_inventory_files())
+
+    # The first of the keys that has already been processed, None if the command is new
+    def find_processed(self, keys):
+        return next((key for key in keys if key in self.processed_keys), None)
+
+    # Journal records waiting for the persistence thread
+    def unwritten_records(self):
+        with self._write_lock:
+            return len(self._unwritten_records)
+
+    # Get a user's inventory as an item -> quantity mapping
+    def get_inventory(self, user_id):
+        return self.user_inventories.get(str(user_id), {})
+
+    # Get how many of an item a user holds
+    def get_quantity(self, user_id, item):
+        return self.user_inventories.get(str(user_id), {}).get(item, 0)
+
+    def _record_change(self, user_id, item, delta):
+        apply_change(self.user_inventories, user_id, item, delta)
+        self._pending_changes.append([user_id, item, delta])
+        item_catalog.add(item)
+        self.item_index.update(user_id, item, self.user_inventories[user_id].get(item, 0))
+
+    # Add a quantity of an item to a user's inventory
+    def add_item(self, user_id, item, quantity):
+        _check_quantity(quantity)
+        self._record_change(str(user_id), item, quantity)
+
+    # Add many (user_id, item, quantity) grants as one change, nothing is applied if any row is invalid
+    def add_items(self, grants):
+        for _, _, quantity in grants:
+            _check_quantity(quantity)
+        for user_id, item, quantity in grants:
+            self._record_change(str(user_id), item, quantity)
+
+    # Remove a quantity of an item from a user's inventory, returns False if they don't hold enough
+    def remove_item(self, user_id, item, quantity):
+        _check_quantity(quantity)
+        if self.get_quantity(user_id, item) < quantity:
+            return False
+        self._record_change(str(user_id), item, -quantity)
+        return True
+
+    # Move a quantity of an item between two users, returns False if the sender doesn't hold enough
+    def transfer_item(self, from_user_id, to_user_id, item, quantity):
+        if not self.remove_item(from_user_id, item, quantity):
+            return False
+        self.add_item(to_user_id, item, quantity)
+        return True
+
+    # Check if a user has the necessary permissions
+    def has_permission(self, ctx, command_name):
+        member = ctx.guild.get_member(ctx.author.id)
+        if not member:
+            return False
+        return self.permission_resolver.has_permission(member, command_name)
+
+    # Check if a member is an administrator, has a mod role or the CG Dev role
+    def is_moderator(self, member):
+        return self.permission_resolver.is_moderator(member)
+
+    # Get the role mentions
+    def get_role_mentions(self):
+        mod_roles = [f"<@&{role_id}>" for role_id in self.role_data["mod_roles"]]
+        return ", ".join(mod_roles) if mod_roles else "@MODERATOR"
+
+def _check_quantity(quantity):
+    if quantity <= 0:
+        raise ValueError("Quantity must be a positive number.")
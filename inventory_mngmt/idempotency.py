@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+
+# How long a processed interaction or idempotency key is remembered, in seconds
+KEY_TTL = 24 * 60 * 60
+# Most keys remembered per bank, the oldest are forgotten first beyond that
+MAX_KEYS = 10000
+
+# Interaction IDs and idempotency keys of mutations that have been applied, each with the
+# time it expires. Keys are added in time order, so the oldest is always first and expiry
+# and the size bound only ever drop from the front.
+class ProcessedKeys:
+    def __init__(self, ttl=KEY_TTL, limit=MAX_KEYS):
+        self.ttl = ttl
+        self.limit = limit
+        self._expires = OrderedDict()
+
+    def _expire(self, now):
+        while self._expires:
+            key, expires = next(iter(self._expires.items()))
+            if expires > now and len(self._expires) <= self.limit:
+                return
+            del self._expires[key]
+
+    def __contains__(self, key):
+        self._expire(time.time())
+        return key in self._expires
+
+    def __len__(self):
+        return len(self._expires)
+
+    # Remember keys, returns them as [key, expires] pairs for the journal
+    def add(self, keys, now=None):
+        now = time.time() if now is None else now
+        entries = [[key, now + self.ttl] for key in keys]
+        self.load(entries)
+        return entries
+
+    # Restore [key, expires] pairs read back from storage
+    def load(self, entries):
+        for key, expires in entries:
+            self._expires.pop(key, None)
+            self._expires[key] = expires
+        self._expire(time.time())
+
+    # Keys that are still live as [key, expires] pairs
+    def items(self):
+        self._expire(time.time())
+        return [[key, expires] for key, expires in self._expires.items()]
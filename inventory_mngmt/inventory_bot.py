@@ -2,29 +2,108 @@ import interactions
 import logging
 import os
 import json
+import signal
+import asyncio
+import contextlib
 
 from dotenv import load_dotenv, dotenv_values
-from config import user_inventories, role_data, get_user_logger, load_roles, save_roles, load_inventories, save_inventories
 
+# Load .env before config so storage settings are picked up
 load_dotenv()
 
+from config import get_bank, owns_guild, shard_file, export_metrics, maintain_logs, METRICS_EXPORT_INTERVAL, LOG_MAINTENANCE_INTERVAL, SHARD_ID, SHARD_COUNT
+from persistence import worker as persistence_worker
+from scheduler import scheduler
+from announcements import announcer
+from pipeline import pipeline
+from dispatcher import dispatcher
+import log_sink
+from command_sync import sync_commands, SYNC_STATE_FILE
+
 # Initialize bot
-bot = interactions.Client(token= os.getenv("token"))
+# Commands are synced in on_ready instead, skipping scopes that haven't changed.
+# With shard_count set, this process is one gateway shard and only sees the guilds it owns.
+# The members intent (switch on "Server Members Intent" in the developer portal) keeps the member
+# cache complete: a guild's members are fetched the first time /cgpass, a role payout or a
+# recurring grant needs them, and member events keep them up to date after that.
+bot = interactions.Client(
+    token= os.getenv("token"), sync_interactions=False, shard_id=SHARD_ID, total_shards=SHARD_COUNT,
+    intents=interactions.Intents.DEFAULT | interactions.Intents.GUILD_MEMBERS
+)
+
+# Keep the Prometheus metrics file current
+@interactions.Task.create(interactions.IntervalTrigger(seconds=METRICS_EXPORT_INTERVAL))
+async def write_metrics():
+    export_metrics()
+
+# Rotate big or old activity logs and pack the ones nobody has touched in a while
+@interactions.Task.create(interactions.IntervalTrigger(seconds=LOG_MAINTENANCE_INTERVAL))
+async def archive_logs():
+    maintain_logs()
 
 # Event handler for bot ready
-@bot.event
+@bot.listen()
 async def on_ready():
-    for guild in bot.guilds:
-        try:
-            await bot.sync_guild(guild.id)
-            print(f"Synced commands for guild: {guild.name} ({guild.id})")
-        except Exception as e:
-            print(f"Failed to sync commands for guild: {guild.name} ({guild.id}). Error: {e}")
-    print(f"Logged in as {bot.user}")
+    # Open each guild's bank up front so its timers are scheduled, the mod roster is built on first use
+    guilds = [guild for guild in bot.guilds if owns_guild(guild.id)]
+    for guild in guilds:
+        get_bank(guild.id)
+    synced, skipped, failed = await sync_commands(bot, guilds, include_global=SHARD_ID == 0, state_file=shard_file(SYNC_STATE_FILE))
+    for name in synced:
+        print(f"Synced commands for {name}")
+    print(f"Command sync: {len(synced)} synced, {len(skipped)} unchanged, {len(failed)} failed")
+    if not write_metrics.started:
+        write_metrics.start()
+    # Expire boosts and run recurring grants of the banks opened above
+    scheduler.start(bot)
+    if not archive_logs.started:
+        maintain_logs()
+        archive_logs.start()
+    print(f"Logged in as {bot.user}, shard {SHARD_ID + 1} of {SHARD_COUNT} with {len(guilds)} guilds")
 
 # Import commands after bot initialization
 from commands.inventory import *
 from commands.admin import *
 from commands.general import *
+from commands.boosts import *
+from commands.events import *
+
+# Longest the bot waits on the way down for queued messages to go out
+SHUTDOWN_TIMEOUT = 10
+
+# Finish commands' background work, post buffered announcements and send everything queued
+# while still connected to Discord
+async def finish_outbound():
+    await pipeline.drain()
+    await announcer.flush_all()
+    await dispatcher.drain()
+
+# Run the bot until it is stopped, e.g. by Ctrl+C or run_shards.py, then finish the outbound
+# work before the connection is closed
+async def run():
+    connection = asyncio.ensure_future(bot.astart())
+    # systemctl stop and container runtimes send SIGTERM, which takes the same way down as Ctrl+C.
+    # Event loop signal handlers aren't available on Windows.
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await asyncio.shield(connection)
+    finally:
+        if not connection.done():
+            try:
+                await asyncio.wait_for(finish_outbound(), SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.warning(f"Stopped with {pipeline.pending()} commands unfinished and {dispatcher.pending()} messages still queued")
+            connection.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await connection
+
+try:
+    with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError):
+        asyncio.run(run())
+finally:
+    # Write out any changes and log lines still waiting on background threads
+    export_metrics()
+    persistence_worker.shutdown()
+    log_sink.stop()
 
-bot.start()
@@ -0,0 +1,66 @@
+from collections.abc import MutableMapping
+
+# user_id -> {item: quantity} mapping that materializes users on first access.
+# `source` is a binary snapshot or the SQLite backend, anything with load(user_id),
+# `user_id in source` and user_ids(). Users who have been looked up or changed live in
+# memory; everyone else stays on disk until they are needed.
+class LazyInventories(MutableMapping):
+    def __init__(self, source=None):
+        self.source = source
+        self._loaded = {}
+        self._deleted = set()
+
+    def __getitem__(self, user_id):
+        inventory = self._loaded.get(user_id)
+        if inventory is None:
+            if self.source is None or user_id in self._deleted:
+                raise KeyError(user_id)
+            inventory = self.source.load(user_id)
+            if inventory is None:
+                raise KeyError(user_id)
+            self._loaded[user_id] = inventory
+        return inventory
+
+    def __setitem__(self, user_id, inventory):
+        self._loaded[user_id] = inventory
+        self._deleted.discard(user_id)
+
+    def __delitem__(self, user_id):
+        if user_id not in self:
+            raise KeyError(user_id)
+        self._loaded.pop(user_id, None)
+        self._deleted.add(user_id)
+
+    def __contains__(self, user_id):
+        if user_id in self._loaded:
+            return True
+        return self.source is not None and user_id not in self._deleted and user_id in self.source
+
+    def _unloaded_ids(self):
+        if self.source is None:
+            return
+        for user_id in self.source.user_ids():
+            if user_id not in self._loaded and user_id not in self._deleted:
+                yield user_id
+
+    def __iter__(self):
+        yield from list(self._loaded)
+        yield from self._unloaded_ids()
+
+    def __len__(self):
+        return len(self._loaded) + sum(1 for _ in self._unloaded_ids())
+
+    # Users removed since the source was written
+    def deleted_ids(self):
+        return set(self._deleted)
+
+    # Users currently held in memory
+    def loaded_items(self):
+        return self._loaded.items()
+
+    # Every item held by someone, read from the source's item table rather than each user
+    def item_names(self):
+        names = set(self.source.item_names()) if self.source is not None else set()
+        for inventory in self._loaded.values():
+            names.update(inventory)
+        return names
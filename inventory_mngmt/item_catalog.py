@@ -0,0 +1,88 @@
+import bisect
+
+# Most choices Discord accepts in an autocomplete response
+MAX_CHOICES = 25
+# Rank of the official items, listed before anything else that turns up in inventories
+RANK_OFFICIAL = 0
+RANK_SEEN = 1
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.top = []  # Best (rank, folded name, name) keys below this node, at most MAX_CHOICES
+
+    def offer(self, key, limit):
+        if key in self.top:
+            return
+        if len(self.top) >= limit and key >= self.top[-1]:
+            return
+        bisect.insort(self.top, key)
+        if len(self.top) > limit:
+            self.top.pop()
+
+# Case-insensitive prefix index over item names.
+# Each name is inserted from the start of every word, so "mill" finds "3h Mill". Every trie node
+# keeps its best MAX_CHOICES names in rank order, so a lookup only walks the typed prefix and
+# never visits the names below it.
+class PrefixIndex:
+    def __init__(self, limit=MAX_CHOICES):
+        self.limit = limit
+        self._root = _Node()
+        self._ranks = {}
+
+    def __contains__(self, name):
+        return name in self._ranks
+
+    def __len__(self):
+        return len(self._ranks)
+
+    def add(self, name, rank=RANK_SEEN):
+        if not name or self._ranks.get(name, rank + 1) <= rank:
+            return
+        previous = self._ranks.get(name)
+        self._ranks[name] = rank
+        for node in self._path_nodes(name):
+            if previous is not None and (previous, name.casefold(), name) in node.top:
+                node.top.remove((previous, name.casefold(), name))
+            node.offer((rank, name.casefold(), name), self.limit)
+
+    # Every node on the paths of a name's word starts, creating them as needed
+    def _path_nodes(self, name):
+        yield self._root
+        for word in word_starts(name.casefold()):
+            node = self._root
+            for character in word:
+                node = node.children.setdefault(character, _Node())
+                yield node
+
+    def update(self, names, rank=RANK_SEEN):
+        for name in names:
+            self.add(name, rank)
+
+    # Names where the text starts the name or one of its words, best first
+    def complete(self, text, limit=MAX_CHOICES):
+        node = self._root
+        for character in text.strip().casefold():
+            node = node.children.get(character)
+            if node is None:
+                return []
+        return [name for _, _, name in node.top[:limit]]
+
+# Each suffix of the name that starts a word
+def word_starts(folded):
+    starts = [0] + [index + 1 for index, character in enumerate(folded) if character in " -_" and index + 1 < len(folded)]
+    return [folded[start:] for start in starts]
+
+def matches(name, text):
+    text = text.strip().casefold()
+    return any(word.startswith(text) for word in word_starts(name.casefold()))
+
+# A user's items matching the text as (item, quantity), largest holding first
+def complete_holdings(inventory, text, limit=MAX_CHOICES):
+    held = [(item, quantity) for item, quantity in inventory.items() if quantity > 0 and matches(item, text)]
+    held.sort(key=lambda entry: (-entry[1], entry[0].casefold()))
+    return held[:limit]
+
+item_catalog = PrefixIndex()
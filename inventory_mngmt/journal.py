@@ -0,0 +1,79 @@
+import os
+import json
+
+# Apply one [user_id, item, delta] change to an inventories mapping, both when a command makes
+# the change and when its record is replayed
+def apply_change(inventories, user_id, item, delta):
+    inventory = inventories.setdefault(user_id, {})
+    remaining = inventory.get(item, 0) + delta
+    if remaining:
+        inventory[item] = remaining
+    else:
+        inventory.pop(item, None)
+
+# Append-only journal of inventory changes.
+# Each line is one compact JSON record: {"seq": 12, "changes": [[user_id, item, delta], ...]}
+# so a trade (two users) is still a single record and is replayed all-or-nothing.
+# A record may also carry "keys": [[key, expires], ...], the interaction IDs and idempotency
+# keys of the commands it applied, so duplicates are still recognised after a restart.
+# Records are numbered on the event loop with record() and written later, in order, with write().
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self._file = None
+
+    # Read every complete record with a sequence number greater than after_seq.
+    # A record can appear twice if a write failed after its bytes reached the file and was
+    # retried, so anything at or below the last sequence number read is skipped.
+    def replay(self, after_seq=0):
+        self.seq = after_seq
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    break  # Partial write from a crash, everything before it is intact
+                record = json.loads(line)
+                if record["seq"] <= self.seq:
+                    continue
+                self.seq = record["seq"]
+                yield record
+
+    # Number a set of changes as the next record
+    def record(self, changes, keys=None):
+        self.seq += 1
+        record = {"seq": self.seq, "changes": changes}
+        if keys:
+            record["keys"] = keys
+        return record
+
+    # Append records to the file with a single write, returns the number of bytes written
+    def write(self, records):
+        if not records:
+            return 0
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8')
+        start = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception:
+            # Cut off whatever made it to the file so the retry doesn't follow a partial line
+            self.close()
+            with open(self.path, 'r+b') as file:
+                file.truncate(start)
+            raise
+        return len(data)
+
+    # Drop all records, called once they are covered by a snapshot
+    def truncate(self):
+        self.close()
+        open(self.path, 'w').close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
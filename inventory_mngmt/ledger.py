@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import bisect
+import threading
+from array import array
+
+from persistence import worker
+
+# Day number (YYYYMMDD, UTC) an event timestamp falls on
+def day_of(timestamp):
+    return int(time.strftime('%Y%m%d', time.gmtime(timestamp)))
+
+def _index_lines(entries):
+    return ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode('utf-8')
+
+# Append to a file. If the write fails part way the file is cut back to where it was, so the
+# retry starts on a fresh line instead of after a partial one.
+def _append(path, data):
+    file = open(path, 'ab')
+    start = file.tell()
+    try:
+        file.write(data)
+        file.close()
+    except Exception:
+        try:
+            file.close()
+        except Exception:
+            pass
+        _truncate(path, start)
+        raise
+
+# Cut a file back to `size` bytes if it is longer
+def _truncate(path, size):
+    if os.path.getsize(path) > size:
+        with open(path, 'r+b') as file:
+            file.truncate(size)
+
+# Append-only ledger of structured bank events, one JSON object per line:
+#   {"ts": 1717166400.0, "kind": "add", "actor": "60275...", "subject": "13526...", "item": "3h Mill", "quantity": 8}
+# A side index file holds one compact [offset, day, subject, item] line per event, so the
+# in-memory offset lists per user, per item and per day can be rebuilt at startup without
+# reading the ledger itself. Queries seek straight to the matching lines.
+# Each guild's bank has its own ledger, `task` is the key it is flushed under.
+class Ledger:
+    def __init__(self, path, index_path, task="ledger"):
+        self.path = path
+        self.index_path = index_path
+        self.task = task
+        self.by_user = {}
+        self.by_item = {}
+        self.day_offsets = []  # (day, first offset of that day), in ledger order
+        self._size = 0
+        self._unwritten = []
+        # Entries whose ledger lines are written but whose index lines failed to, only touched by _flush
+        self._unindexed = []
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _add_to_index(self, offset, day, subject, item):
+        self.by_user.setdefault(subject, array('Q')).append(offset)
+        if item is not None:
+            self.by_item.setdefault(item, array('Q')).append(offset)
+        if not self.day_offsets or self.day_offsets[-1][0] != day:
+            self.day_offsets.append((day, offset))
+
+    def _load_index(self):
+        ledger_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        indexed_to = 0
+        index_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as file:
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    offset, day, subject, item = json.loads(line)
+                    if offset >= ledger_size:
+                        break
+                    self._add_to_index(offset, day, subject, item)
+                    indexed_to = offset
+                    index_end += len(line)
+            # Drop a partial line or entries past the end of the ledger, so new entries start on a line of their own
+            _truncate(self.index_path, index_end)
+        # Index the tail of the ledger in case the bot stopped between the two writes
+        missing = []
+        if ledger_size:
+            with open(self.path, 'rb') as file:
+                file.seek(indexed_to)
+                if self.by_user:
+                    file.readline()
+                offset = file.tell()
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    event = json.loads(line)
+                    entry = [offset, day_of(event["ts"]), event["subject"], event.get("item")]
+                    self._add_to_index(*entry)
+                    missing.append(entry)
+                    offset += len(line)
+            # A partial last line from a crash is cut off, otherwise the next event would be appended to it
+            _truncate(self.path, offset)
+            ledger_size = offset
+        self._size = ledger_size
+        if missing:
+            _append(self.index_path, _index_lines(missing))
+
+    # Record an event, it is indexed immediately and written by the persistence thread
+    def record(self, kind, actor, subject, item=None, quantity=None, **details):
+        event = {"ts": round(time.time(), 3), "kind": kind, "actor": str(actor), "subject": str(subject)}
+        if item is not None:
+            event["item"] = item
+        if quantity is not None:
+            event["quantity"] = quantity
+        event.update(details)
+        line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+        entry = [self._size, day_of(event["ts"]), event["subject"], item]
+        self._add_to_index(*entry)
+        self._size += len(line)
+        with self._lock:
+            self._unwritten.append((line, entry))
+        worker.schedule(self.task, self._flush)
+        return event
+
+    # Runs on the persistence thread. The ledger is written before the index so the index
+    # never points past the end of the ledger. Lines stay in _unwritten until they are on
+    # disk so readers always find them in one place or the other, and index entries stay in
+    # _unindexed until theirs are.
+    def _flush(self):
+        with self._lock:
+            unwritten = list(self._unwritten)
+        written = 0
+        if unwritten:
+            lines = b''.join(line for line, _ in unwritten)
+            _append(self.path, lines)
+            written += len(lines)
+            with self._lock:
+                del self._unwritten[:len(unwritten)]
+            self._unindexed.extend(entry for _, entry in unwritten)
+        if self._unindexed:
+            index = _index_lines(self._unindexed)
+            _append(self.index_path, index)
+            written += len(index)
+            self._unindexed.clear()
+        return written
+
+    # Read the events at the given offsets, including ones not yet flushed to disk
+    def _read(self, offsets):
+        events = []
+        with self._lock:
+            pending = {entry[0]: line for line, entry in self._unwritten}
+        file = None
+        try:
+            for offset in offsets:
+                line = pending.get(offset)
+                if line is None:
+                    if file is None:
+                        file = open(self.path, 'rb')
+                    file.seek(offset)
+                    line = file.readline()
+                events.append(json.loads(line))
+        finally:
+            if file is not None:
+                file.close()
+        return events
+
+    # First ledger offset on or after the given day, or None if there is nothing that recent
+    def _offset_for_day(self, day):
+        position = bisect.bisect_left(self.day_offsets, (day, -1))
+        if position == len(self.day_offsets):
+            return None
+        return self.day_offsets[position][1]
+
+    def _select(self, offsets, since_day, limit, matches):
+        start = 0
+        if since_day is not None:
+            since_offset = self._offset_for_day(since_day)
+            if since_offset is None:
+                return []
+            start = bisect.bisect_left(offsets, since_offset)
+        selected = []
+        # Newest first, reading back in small batches until the limit is filled
+        end = len(offsets)
+        while end > start and (limit is None or len(selected) < limit):
+            batch_start = max(start, end - (limit or 50))
+            for event in reversed(self._read(offsets[batch_start:end])):
+                if matches(event):
+                    selected.append(event)
+                    if limit is not None and len(selected) >= limit:
+                        break
+            end = batch_start
+        return selected
+
+    # Events where the user is the subject, newest first
+    def history(self, user_id, item=None, kind=None, since_day=None, limit=None):
+        offsets = self.by_user.get(str(user_id), array('Q'))
+        return self._select(
+            offsets, since_day, limit,
+            lambda event: (item is None or event.get("item") == item) and (kind is None or event["kind"] == kind)
+        )
+
+    # Events involving an item across all users, newest first
+    def item_history(self, item, kind=None, since_day=None, limit=None):
+        offsets = self.by_item.get(item, array('Q'))
+        return self._select(offsets, since_day, limit, lambda event: kind is None or event["kind"] == kind)
+
+    # Every event from since_day up to and including until_day, oldest first
+    def events_between(self, since_day, until_day=None):
+        start = self._offset_for_day(since_day)
+        if start is None:
+            return []
+        stop = self._size
+        if until_day is not None:
+            stop = self._offset_for_day(until_day + 1)
+            if stop is None:
+                stop = self._size
+        with self._lock:
+            pending = [(entry[0], line) for line, entry in self._unwritten]
+        file_end = pending[0][0] if pending else self._size
+        events = []
+        if start < min(stop, file_end):
+            with open(self.path, 'rb') as file:
+                file.seek(start)
+                data = file.read(min(stop, file_end) - start)
+            events = [json.loads(line) for line in data.splitlines()]
+        events.extend(json.loads(line) for offset, line in pending if start <= offset < stop)
+        return events
@@ -0,0 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+# Per-user asyncio locks for inventory changes.
+# Commands touching the same user run one after another, commands for unrelated users
+# run in parallel. Multi-user operations (trades) take their locks in sorted order so
+# two trades between the same pair of users can never deadlock.
+class UserLocks:
+    def __init__(self):
+        self._locks = {}
+        self._users = {}  # user_id -> number of holders and waiters, lock is dropped at zero
+
+    @asynccontextmanager
+    async def hold(self, *user_ids):
+        user_ids = sorted({str(user_id) for user_id in user_ids})
+        for user_id in user_ids:
+            if user_id not in self._locks:
+                self._locks[user_id] = asyncio.Lock()
+            self._users[user_id] = self._users.get(user_id, 0) + 1
+        acquired = []
+        try:
+            for user_id in user_ids:
+                await self._locks[user_id].acquire()
+                acquired.append(user_id)
+            yield
+        finally:
+            for user_id in reversed(acquired):
+                self._locks[user_id].release()
+            for user_id in user_ids:
+                self._users[user_id] -= 1
+                if not self._users[user_id]:
+                    del self._users[user_id]
+                    del self._locks[user_id]
+
+    def is_locked(self, user_id):
+        lock = self._locks.get(str(user_id))
+        return lock is not None and lock.locked()
+
+user_locks = UserLocks()
@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import struct
+import argparse
+import threading
+
+# A live log is rotated into a gzip segment once it reaches this size, or once its first line is this old
+LOG_SEGMENT_BYTES = 256 * 1024
+LOG_SEGMENT_AGE = 30 * 24 * 60 * 60
+# A user whose log hasn't been written for this long has all of it moved into the packed archive
+LOG_COLD_AGE = 30 * 24 * 60 * 60
+# A new pack is started once the current one reaches this size
+PACK_BYTES = 64 * 1024 * 1024
+ARCHIVE_DIR = 'archive'
+ARCHIVE_INDEX = 'index.jsonl'
+# Start of every line written with log_sink.LOG_FORMAT
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SEGMENT_PATTERN = re.compile(r'^(.+)\.(\d{6})\.log(\.gz)?$')
+ISIZE = struct.Struct('<I')
+
+# A log is known by its live file name without ".log", e.g. "1352..." or "bot_1352..."
+def log_name(log_path):
+    return os.path.basename(log_path)[:-len('.log')]
+
+def segment_path(log_path, seq, compressed=True):
+    return f"{log_path[:-len('.log')]}.{seq:06d}.log" + ('.gz' if compressed else '')
+
+# Uncompressed size of a single-member gzip file, from its trailer
+def gzip_size(path):
+    with open(path, 'rb') as file:
+        file.seek(-ISIZE.size, os.SEEK_END)
+        return ISIZE.unpack(file.read(ISIZE.size))[0]
+
+def read_gzip(path):
+    with open(path, 'rb') as file:
+        return gzip.decompress(file.read())
+
+def _fsync_write(path, data, mode='wb'):
+    with open(path, mode) as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+# Gzip members of cold logs appended to pack files, with an index of where each one is.
+# The index is one JSON line per segment:
+#   {"log": "1352...", "seq": 3, "pack": 1, "offset": 0, "length": 5120, "size": 262144}
+# and is written after the pack data it points at, so it never refers to a partial member.
+# The whole index is held in memory, keyed by log name.
+class LogArchive:
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, ARCHIVE_DIR)
+        self.index_path = os.path.join(self.directory, ARCHIVE_INDEX)
+        # Held while segments change hands, so readers always see each one exactly once
+        self.lock = threading.RLock()
+        self._entries = {}  # log name -> [entry] by seq
+        self._pack = 1
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    break  # Partial write from a crash, the segments are still in their files
+                entry = json.loads(line)
+                self._entries.setdefault(entry["log"], []).append(entry)
+                self._pack = max(self._pack, entry["pack"])
+        for entries in self._entries.values():
+            entries.sort(key=lambda entry: entry["seq"])
+
+    def pack_path(self, pack):
+        return os.path.join(self.directory, f"pack-{pack:06d}.pack")
+
+    def entries(self, name):
+        with self.lock:
+            return list(self._entries.get(name, ()))
+
+    def last_seq(self, name):
+        with self.lock:
+            entries = self._entries.get(name)
+            return entries[-1]["seq"] if entries else 0
+
+    # Append (seq, gzip bytes, uncompressed size) segments of one log, returns the bytes written
+    def add(self, name, segments):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.pack_path(self._pack)
+        if os.path.exists(path) and os.path.getsize(path) >= PACK_BYTES:
+            self._pack += 1
+            path = self.pack_path(self._pack)
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        entries = []
+        for seq, data, size in segments:
+            entries.append({"log": name, "seq": seq, "pack": self._pack, "offset": offset, "length": len(data), "size": size})
+            offset += len(data)
+        data = b''.join(data for _, data, _ in segments)
+        _fsync_write(path, data, 'ab')
+        index = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode('utf-8')
+        _fsync_write(self.index_path, index, 'ab')
+        with self.lock:
+            self._entries.setdefault(name, []).extend(entries)
+        return len(data) + len(index)
+
+    def read(self, entry):
+        with open(self.pack_path(entry["pack"]), 'rb') as file:
+            file.seek(entry["offset"])
+            return gzip.decompress(file.read(entry["length"]))
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+# The archive of a logs directory, loaded once per process
+def get_archive(directory):
+    directory = os.path.normpath(directory)
+    with _archives_lock:
+        if directory not in _archives:
+            _archives[directory] = LogArchive(directory)
+        return _archives[directory]
+
+# Rotated segment files of a log as {seq: path}, preferring the compressed copy.
+# Sequence numbers carry on from the archive without gaps, so probing stops at the first missing one.
+def _segment_files(log_path, after_seq):
+    files = {}
+    seq = after_seq + 1
+    while True:
+        compressed = segment_path(log_path, seq)
+        plain = segment_path(log_path, seq, compressed=False)
+        if os.path.exists(compressed):
+            files[seq] = compressed
+        elif os.path.exists(plain):
+            files[seq] = plain
+        else:
+            return files
+        seq += 1
+
+# Move the live file into the next segment and compress it. Callers make sure nothing is
+# writing to the file. Returns the number of bytes written.
+def rotate(log_path):
+    if not os.path.exists(log_path) or not os.path.getsize(log_path):
+        return 0
+    archive = get_archive(os.path.dirname(log_path))
+    with archive.lock:
+        after_seq = archive.last_seq(log_name(log_path))
+        seq = after_seq + len(_segment_files(log_path, after_seq)) + 1
+        plain = segment_path(log_path, seq, compressed=False)
+        os.replace(log_path, plain)
+    return compress_segment(plain)
+
+# Replace a rotated plain segment with its gzip copy
+def compress_segment(plain_path):
+    with open(plain_path, 'rb') as file:
+        data = gzip.compress(file.read())
+    temp_path = plain_path + '.gz.tmp'
+    _fsync_write(temp_path, data)
+    os.replace(temp_path, plain_path + '.gz')
+    os.remove(plain_path)
+    return len(data)
+
+# Move everything of a cold log into the archive: rotate the live file, pack every segment
+# and delete the files. Returns the number of bytes written.
+def archive_log(log_path):
+    written = rotate(log_path)
+    archive = get_archive(os.path.dirname(log_path))
+    name = log_name(log_path)
+    files = _segment_files(log_path, archive.last_seq(name))
+    if not files:
+        return written
+    segments = []
+    for seq, path in sorted(files.items()):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if path.endswith('.gz'):
+            segments.append((seq, data, gzip_size(path)))
+        else:
+            segments.append((seq, gzip.compress(data), len(data)))
+    with archive.lock:
+        written += archive.add(name, segments)
+        for path in files.values():
+            os.remove(path)
+    return written
+
+# Time of a log line written with log_sink.LOG_FORMAT, None if it doesn't start with one
+def line_time(line):
+    try:
+        return time.mktime(time.strptime(line[:19].decode('utf-8'), LOG_TIME_FORMAT))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def _first_line_time(log_path):
+    with open(log_path, 'rb') as file:
+        return line_time(file.readline())
+
+# One pass over a logs directory: compress leftover plain segments, rotate live files that are
+# too big or too old and archive logs nobody has written to in LOG_COLD_AGE.
+# `exclusive(path)` is a context manager that keeps the log writer off a file meanwhile.
+# Returns the number of bytes written.
+def maintain(directory, exclusive, now=None):
+    now = time.time() if now is None else now
+    archive = get_archive(directory)
+    logs = {}  # log path -> newest modification time of the live file and its segments
+    leftovers = {}  # log path -> plain segments left behind by a crash
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            match = SEGMENT_PATTERN.match(entry.name)
+            if match:
+                log_path = os.path.join(directory, match.group(1) + '.log')
+                if int(match.group(2)) <= archive.last_seq(match.group(1)):
+                    os.remove(entry.path)  # Already archived, the bot stopped before deleting it
+                    continue
+                if not match.group(3):
+                    leftovers.setdefault(log_path, []).append(entry.path)
+            elif entry.name.endswith('.log'):
+                log_path = entry.path
+            else:
+                continue
+            logs[log_path] = max(logs.get(log_path, 0), entry.stat().st_mtime)
+    written = 0
+    for log_path, modified in logs.items():
+        with exclusive(log_path):
+            for path in leftovers.get(log_path, ()):
+                if os.path.exists(path):
+                    written += compress_segment(path)
+            if modified < now - LOG_COLD_AGE:
+                written += archive_log(log_path)
+            elif os.path.exists(log_path):
+                first = _first_line_time(log_path)
+                if os.path.getsize(log_path) >= LOG_SEGMENT_BYTES or (first and first < now - LOG_SEGMENT_AGE):
+                    written += rotate(log_path)
+    return written
+
+class _PlainSegment:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def read(self, offset, length):
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+class _LoadedSegment:
+    def __init__(self, load, size):
+        self._load = load
+        self._data = None
+        self.size = size
+
+    def read(self, offset, length):
+        if self._data is None:
+            self._data = self._load()
+        return self._data[offset:offset + length]
+
+# A log's archived, rotated and live segments read as one byte stream, oldest first.
+# Offsets into it stay valid as the log is rotated and archived, because segments only ever
+# change where they are kept, never their contents or order.
+class SegmentedLog:
+    def __init__(self, log_path):
+        directory = os.path.dirname(log_path) or '.'
+        archive = get_archive(directory)
+        name = log_name(log_path)
+        self.segments = []
+        with archive.lock:
+            entries = archive.entries(name)
+            for entry in entries:
+                self.segments.append(_LoadedSegment(lambda entry=entry: archive.read(entry), entry["size"]))
+            for seq, path in sorted(_segment_files(log_path, entries[-1]["seq"] if entries else 0).items()):
+                if path.endswith('.gz'):
+                    self.segments.append(_LoadedSegment(lambda path=path: read_gzip(path), gzip_size(path)))
+                else:
+                    self.segments.append(_PlainSegment(path, os.path.getsize(path)))
+            if os.path.exists(log_path):
+                self.segments.append(_PlainSegment(log_path, os.path.getsize(log_path)))
+        self.size = sum(segment.size for segment in self.segments)
+
+    def read(self, position, length):
+        chunks = []
+        start = 0
+        for segment in self.segments:
+            end = start + segment.size
+            if end > position and start < position + length:
+                offset = max(position - start, 0)
+                chunks.append(segment.read(offset, min(end, position + length) - start - offset))
+            start = end
+        return b''.join(chunks)
+
+# Open a log for reading, retrying if a segment moves while it is being listed or read
+def open_log(log_path, read=None, attempts=3):
+    for attempt in range(attempts):
+        try:
+            log = SegmentedLog(log_path)
+            return log if read is None else read(log)
+        except FileNotFoundError:
+            if attempt == attempts - 1:
+                raise
+
+# Every line of a log across all its segments, oldest first
+def iter_lines(log_path, chunk_size=1024 * 1024):
+    log = open_log(log_path)
+    buffer = b''
+    for position in range(0, log.size, chunk_size):
+        buffer += log.read(position, chunk_size)
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8', errors='replace')
+    if buffer:
+        yield buffer.decode('utf-8', errors='replace')
+
+# Print a log in full, e.g. for an audit:
+#   python inventory_mngmt/log_archive.py logs/1352....log
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a user log across its live, rotated and archived segments.")
+    parser.add_argument("log", help="path of the live log file, e.g. logs/<user_id>.log")
+    args = parser.parse_args(argv)
+    for line in iter_lines(args.log):
+        sys.stdout.write(line + '\n')
+
+if __name__ == "__main__":
+    main()
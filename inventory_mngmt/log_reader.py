@@ -0,0 +1,46 @@
+import log_archive
+
+CHUNK_SIZE = 4096
+
+# Read up to `count` lines backwards from byte offset `end` (end of the log when None),
+# stopping early once the lines would take more than `max_chars` characters.
+# The log is read as one stream across its archived, rotated and live segments, and only
+# the part that is actually returned gets read, so the cost of a page does not depend on
+# how long the log is.
+# Returns (lines oldest first, cursor), where cursor is the offset to pass as `end` for the
+# next older page, or 0 when the start of the log has been reached.
+def read_lines_backwards(path, end=None, count=15, max_chars=None):
+    return log_archive.open_log(path, lambda log: _read_backwards(log, end, count, max_chars))
+
+def _read_backwards(log, end, count, max_chars):
+    position = log.size if end is None else min(end, log.size)
+    lines = []
+    used_chars = 0
+    buffer = b''
+    # Ignore the trailing newline of the last line
+    if end is None and position and log.read(position - 1, 1) == b'\n':
+        position -= 1
+    line_end = position
+    while position > 0 and len(lines) < count:
+        read_size = min(CHUNK_SIZE, position)
+        position -= read_size
+        buffer = log.read(position, read_size) + buffer
+        while len(lines) < count:
+            newline = buffer.rfind(b'\n')
+            if newline == -1:
+                break
+            line = buffer[newline + 1:].decode('utf-8', errors='replace').rstrip('\r')
+            if max_chars is not None and lines and used_chars + len(line) + 1 > max_chars:
+                return lines[::-1], line_end
+            lines.append(line)
+            used_chars += len(line) + 1
+            line_end = position + newline
+            buffer = buffer[:newline]
+    # Whatever is left at the start of the log is the first line
+    if position == 0 and buffer and len(lines) < count:
+        line = buffer.decode('utf-8', errors='replace').rstrip('\r')
+        if max_chars is not None and lines and used_chars + len(line) + 1 > max_chars:
+            return lines[::-1], line_end
+        lines.append(line)
+        line_end = 0
+    return lines[::-1], line_end
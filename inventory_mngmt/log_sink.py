@@ -0,0 +1,105 @@
+import time
+import queue
+import logging
+import logging.handlers
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import log_archive
+from metrics import metrics
+
+# Most per-user log files kept open at once, the least recently written one is closed beyond that
+MAX_OPEN_LOG_FILES = 64
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Writes each record to the file named by its `log_file` attribute.
+# Only a bounded number of files stay open, so the fd count no longer grows with the member count.
+# A file that reaches log_archive.LOG_SEGMENT_BYTES is rotated into a gzip segment right away.
+class RoutingFileHandler(logging.Handler):
+    def __init__(self, max_open=MAX_OPEN_LOG_FILES):
+        super().__init__()
+        self.max_open = max_open
+        self._files = OrderedDict()
+
+    def _get_file(self, path):
+        file = self._files.pop(path, None)
+        if file is None:
+            file = open(path, 'a', encoding='utf-8')
+        self._files[path] = file
+        while len(self._files) > self.max_open:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        return file
+
+    def emit(self, record):
+        started = time.perf_counter()
+        try:
+            line = self.format(record) + '\n'
+            file = self._get_file(record.log_file)
+            file.write(line)
+            file.flush()
+            metrics.increment("persisted_bytes_total", len(line.encode('utf-8')), task="logs")
+            if file.tell() >= log_archive.LOG_SEGMENT_BYTES:
+                self._close_file(record.log_file)
+                metrics.increment("persisted_bytes_total", log_archive.rotate(record.log_file), task="log_archive")
+        except Exception:
+            self.handleError(record)
+        finally:
+            metrics.observe("log_write_seconds", time.perf_counter() - started)
+
+    def _close_file(self, path):
+        file = self._files.pop(path, None)
+        if file is not None:
+            file.close()
+
+    # Keep records off a file while it is rotated or archived, they wait on the handler lock
+    @contextmanager
+    def exclusive(self, path):
+        self.acquire()
+        try:
+            self._close_file(path)
+            yield
+        finally:
+            self.release()
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+        super().close()
+
+# Records are queued on the event loop and written by the listener thread
+_queue = queue.SimpleQueue()
+_file_handler = RoutingFileHandler()
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+_listener = logging.handlers.QueueListener(_queue, _file_handler)
+
+_sink_logger = logging.getLogger("cgbank.activity")
+_sink_logger.addHandler(logging.handlers.QueueHandler(_queue))
+_sink_logger.setLevel(logging.INFO)
+
+_started = False
+metrics.gauge("log_queue_depth", _queue.qsize)
+
+def start():
+    global _started
+    if not _started:
+        _listener.start()
+        _started = True
+
+# Write out everything still queued and close the open files
+def stop():
+    global _started
+    if _started:
+        _listener.stop()
+        _started = False
+    _file_handler.close()
+
+# Rotate, compress and archive the logs in a directory, returns the number of bytes written
+def maintain(directory):
+    return log_archive.maintain(directory, _file_handler.exclusive)
+
+# Logger that appends to the given file through the shared queue
+def get_file_logger(path):
+    start()
+    return logging.LoggerAdapter(_sink_logger, {"log_file": path})
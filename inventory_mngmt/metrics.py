@@ -0,0 +1,201 @@
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+
+from dispatcher import dispatcher
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = "cgbank_"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    # Estimate a quantile by interpolating inside its bucket, like Prometheus' histogram_quantile
+    def quantile(self, q):
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count, histogram.sum, histogram.max = self.count, self.sum, self.max
+        return histogram
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+# Process-wide latency histograms, counters and gauges.
+# Recorded from the event loop, the persistence thread and the log thread, read by /bankstats
+# and rendered in the Prometheus text format for the metrics file.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # name -> {label key: Histogram}
+        self._counters = {}  # name -> {label key: value}
+        self._gauges = {}  # name -> callable returning the current value
+        self.started_at = time.time()
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    # Register a gauge, `read` is called whenever the metrics are read
+    def gauge(self, name, read):
+        self._gauges[name] = read
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # Decorator timing every call of a plain function
+    def timed(self, name, **labels):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Copies of a histogram's series as {labels dict: Histogram}
+    def histograms(self, name):
+        with self._lock:
+            series = dict(self._histograms.get(name, {}))
+            return [(dict(key), histogram.copy()) for key, histogram in series.items()]
+
+    # A counter's series as [(labels dict, value)]
+    def counters(self, name):
+        with self._lock:
+            return [(dict(key), value) for key, value in self._counters.get(name, {}).items()]
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def gauges(self):
+        values = {"uptime_seconds": time.time() - self.started_at}
+        for name, read in list(self._gauges.items()):
+            try:
+                values[name] = read()
+            except Exception:
+                continue
+        return values
+
+    # Everything in the Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            histograms = {name: {key: histogram.copy() for key, histogram in series.items()}
+                          for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+        lines = []
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(key)} {histogram.sum!r}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(key)} {histogram.count}")
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels(key)} {value}")
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+            lines.append(f"{METRIC_PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# Context handed to instrumented commands: forwards everything to the real context but times
+# the calls that go out to Discord and notices replies that report a handled error.
+class MeteredContext:
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self.failed = False
+
+    def __getattr__(self, name):
+        return getattr(self._ctx, name)
+
+    async def send(self, *args, **kwargs):
+        # Handlers catch their own exceptions and reply with "Error: ..."
+        content = args[0] if args else kwargs.get("content")
+        if isinstance(content, str) and content.startswith("Error:"):
+            self.failed = True
+        with metrics.timer("discord_send_seconds", method="send"):
+            return await self._ctx.send(*args, **kwargs)
+
+    async def defer(self, *args, **kwargs):
+        with metrics.timer("discord_send_seconds", method="defer"):
+            return await self._ctx.defer(*args, **kwargs)
+
+    async def edit_origin(self, *args, **kwargs):
+        with metrics.timer("discord_send_seconds", method="edit_origin"):
+            return await self._ctx.edit_origin(*args, **kwargs)
+
+# Decorator for command and component callbacks: latency histogram and error count per command.
+# Queued outbound messages hold back while a command is being answered.
+def instrumented(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        metered = MeteredContext(ctx)
+        started = time.perf_counter()
+        try:
+            async with dispatcher.responding():
+                return await func(metered, *args, **kwargs)
+        except Exception:
+            metered.failed = True
+            raise
+        finally:
+            metrics.observe("command_seconds", time.perf_counter() - started, command=name)
+            metrics.increment("commands_total", command=name)
+            if metered.failed:
+                metrics.increment("command_errors_total", command=name)
+    return wrapper
@@ -0,0 +1,71 @@
+import interactions
+
+CG_DEV_ROLE_NAME = "🏆 CG Dev"
+# Commands that need a moderator or an explicit grant, everything else is open to everyone
+GATED_COMMANDS = frozenset({"additem", "removeitem"})
+
+# Caches everything has_permission and the admin checks need.
+# Granted commands are kept as a deduplicated set per user, the CG Dev role ID is looked up
+# once per guild, and whether a member counts as a moderator is cached per (guild, member).
+# Call reload() when role_data changes and invalidate_* from role/member gateway events; member
+# updates arrive with the members intent, which inventory_bot.py requests.
+class PermissionResolver:
+    def __init__(self, role_data):
+        self.role_data = role_data
+        self._user_permissions = None
+        self._mod_roles = None
+        self._cg_dev_roles = {}
+        self._moderators = {}
+
+    # role_data changed: rebuild the permission sets and forget every member's status
+    def reload(self):
+        self._user_permissions = None
+        self._mod_roles = None
+        self._moderators.clear()
+
+    # A guild's roles changed, e.g. the CG Dev role was renamed, created or deleted
+    def invalidate_guild(self, guild_id):
+        self._cg_dev_roles.pop(int(guild_id), None)
+        for key in [key for key in self._moderators if key[0] == int(guild_id)]:
+            del self._moderators[key]
+
+    # A member's roles changed or they left
+    def invalidate_member(self, guild_id, member_id):
+        self._moderators.pop((int(guild_id), int(member_id)), None)
+
+    def user_permissions(self, user_id):
+        if self._user_permissions is None:
+            self._user_permissions = {
+                user_id: frozenset(commands) for user_id, commands in self.role_data["permissions"].items()
+            }
+        return self._user_permissions.get(str(user_id), frozenset())
+
+    def mod_roles(self):
+        if self._mod_roles is None:
+            self._mod_roles = frozenset(self.role_data["mod_roles"])
+        return self._mod_roles
+
+    def cg_dev_role_id(self, guild):
+        guild_id = int(guild.id)
+        if guild_id not in self._cg_dev_roles:
+            role = next((role for role in guild.roles if role.name == CG_DEV_ROLE_NAME), None)
+            self._cg_dev_roles[guild_id] = role.id if role else None
+        return self._cg_dev_roles[guild_id]
+
+    # Administrators, members with a mod role and members with the CG Dev role
+    def is_moderator(self, member):
+        key = (int(member.guild.id), int(member.id))
+        if key not in self._moderators:
+            role_ids = {role.id for role in member.roles}
+            cg_dev_role_id = self.cg_dev_role_id(member.guild)
+            self._moderators[key] = (
+                member.has_permission(interactions.Permissions.ADMINISTRATOR) or
+                not self.mod_roles().isdisjoint(role_ids) or
+                (cg_dev_role_id is not None and cg_dev_role_id in role_ids)
+            )
+        return self._moderators[key]
+
+    def has_permission(self, member, command_name):
+        if command_name not in GATED_COMMANDS:
+            return True
+        return command_name in self.user_permissions(member.id) or self.is_moderator(member)
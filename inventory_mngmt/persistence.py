@@ -0,0 +1,96 @@
+import os
+import json
+import logging
+import tempfile
+import time
+import threading
+
+from metrics import metrics
+
+# How often the background writer flushes dirty state, in seconds
+FLUSH_INTERVAL = 1.0
+
+# Write to a temp file next to the target and atomically rename it into place,
+# so a crash can never leave a truncated file behind. Returns the number of bytes written.
+def _write_atomic(path, write):
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+            size = os.fstat(file.fileno()).st_size
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return size
+
+def write_json_atomic(path, data, **dump_kwargs):
+    return _write_atomic(path, lambda file: json.dump(data, file, **dump_kwargs))
+
+def write_text_atomic(path, text):
+    return _write_atomic(path, lambda file: file.write(text))
+
+# Runs disk writes on a background thread.
+# Handlers schedule a flush task under a key; scheduling the same key again before the
+# next flush replaces the earlier task, so a burst of changes costs one write per interval.
+# Tasks may return the number of bytes they wrote, which is counted per key in the metrics.
+# Keys may name a partition after a colon, e.g. "inventories:<guild_id>"; each partition is
+# its own task but they share one metrics series.
+class PersistenceWorker:
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def schedule(self, key, task):
+        with self._lock:
+            self._tasks[key] = task
+            if self._thread is None and not self._stopping.is_set():
+                self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+                self._thread.start()
+
+    # Tasks waiting for the next flush
+    def pending(self):
+        with self._lock:
+            return len(self._tasks)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.flush()
+
+    # Run every pending task now, on the calling thread
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                tasks, self._tasks = self._tasks, {}
+            for key, task in tasks.items():
+                name = key.partition(":")[0]
+                started = time.perf_counter()
+                try:
+                    written = task()
+                    if written:
+                        metrics.increment("persisted_bytes_total", written, task=name)
+                except Exception as e:
+                    logging.error(f"Failed to persist {key}: {str(e)}")
+                    metrics.increment("persist_failures_total", task=name)
+                    # Retry on the next flush unless a newer task has replaced it
+                    with self._lock:
+                        self._tasks.setdefault(key, task)
+                finally:
+                    metrics.observe("persist_seconds", time.perf_counter() - started, task=name)
+
+    # Stop the background thread and write out anything still pending
+    def shutdown(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+worker = PersistenceWorker()
+metrics.gauge("persist_queue_depth", worker.pending)
@@ -0,0 +1,62 @@
+import asyncio
+import inspect
+import logging
+
+from metrics import metrics
+from config import get_logo_files, send_with_logo
+
+# Commands that change the bank answer as soon as the change is made in memory.
+# The answer goes out straight away when its embeds use the hosted logo; when they were built
+# before the logo was hosted the interaction is deferred and the logo upload joins the rest of the work. That rest (activity log lines,
+# announcements) runs in a background task after the handler has returned, one step at a time,
+# and a step that fails is reported to the caller in an ephemeral follow-up.
+# Journal records and ledger events are only in-memory appends and stay inside the handler: the
+# journal record carries the command's idempotency keys, so a duplicate can never slip in before
+# the change is recorded, and the ledger never misses a change that made it into the journal.
+class CommandPipeline:
+    def __init__(self):
+        self._tasks = set()
+
+    # Answer with the result and run `steps` once the answer has gone out.
+    # Steps are zero-argument callables, plain or returning an awaitable.
+    async def finish(self, ctx, command, *steps, content=None, embeds=None, ephemeral=True):
+        files = get_logo_files(embeds)
+        if files:
+            if not ctx.deferred:
+                await ctx.defer(ephemeral=ephemeral)
+            steps = (lambda: send_with_logo(ctx, embeds, files, content=content, ephemeral=ephemeral),) + steps
+        else:
+            await ctx.send(content=content, embeds=embeds, ephemeral=ephemeral)
+        self.run_later(ctx, command, *steps)
+
+    def run_later(self, ctx, command, *steps):
+        task = asyncio.get_running_loop().create_task(self._run(ctx, command, steps))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, ctx, command, steps):
+        with metrics.timer("background_seconds", command=command):
+            for step in steps:
+                try:
+                    result = step()
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    metrics.increment("background_errors_total", command=command)
+                    logging.error(f"Error finishing /{command}: {str(e)}")
+                    try:
+                        await ctx.send(f"Error: the change was made, but finishing it failed: {str(e)}", ephemeral=True)
+                    except Exception as send_error:
+                        logging.error(f"Failed to report an error in /{command}: {str(send_error)}")
+
+    # Background tasks still running
+    def pending(self):
+        return len(self._tasks)
+
+    # Wait for every background task, e.g. before shutting down
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+pipeline = CommandPipeline()
+metrics.gauge("background_tasks", pipeline.pending)
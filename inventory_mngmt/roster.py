@@ -0,0 +1,96 @@
+from permissions import CG_DEV_ROLE_NAME
+
+# Who holds each mod role and who has specific command permissions, per guild.
+# Built once per guild on first use, after its members are fetched, and then kept up to date from
+# member/role events and permission changes, so /cgpass never scans the guild.
+# Member events only arrive with the members intent, which inventory_bot.py requests.
+class GuildRoster:
+    def __init__(self):
+        self.role_names = {}  # role_id -> name, in display order
+        self.role_members = {}  # role_id -> set of member IDs
+        self.permission_holders = set()
+        self._fields = None
+
+    # Embed fields for /cgpass as (name, value) pairs, rebuilt only after a change
+    def fields(self):
+        if self._fields is None:
+            fields = []
+            for role_id, name in self.role_names.items():
+                members = self.role_members.get(role_id)
+                if members:
+                    fields.append((name, "\n".join(f"<@{member_id}>" for member_id in sorted(members))))
+            if self.permission_holders:
+                fields.append((
+                    "Specific Command Permissions",
+                    "\n".join(f"<@{member_id}>" for member_id in sorted(self.permission_holders))
+                ))
+            self._fields = fields
+        return self._fields
+
+    def changed(self):
+        self._fields = None
+
+class RosterIndex:
+    def __init__(self, role_data):
+        self.role_data = role_data
+        self._guilds = {}
+
+    def build(self, guild):
+        roster = GuildRoster()
+        role_ids = list(dict.fromkeys(self.role_data["mod_roles"]))  # Ensure no duplicates
+        # Include CG Dev role explicitly if not already included
+        cg_dev_role = next((role for role in guild.roles if role.name == CG_DEV_ROLE_NAME), None)
+        if cg_dev_role and cg_dev_role.id not in role_ids:
+            role_ids.append(cg_dev_role.id)
+        for role_id in role_ids:
+            role = guild.get_role(role_id)
+            if role:
+                roster.role_names[int(role.id)] = role.name
+                roster.role_members[int(role.id)] = {int(member.id) for member in role.members}
+        for user_id, permissions in self.role_data["permissions"].items():
+            if permissions and guild.get_member(int(user_id)):
+                roster.permission_holders.add(int(user_id))
+        self._guilds[int(guild.id)] = roster
+        return roster
+
+    def get(self, guild):
+        return self._guilds.get(int(guild.id)) or self.build(guild)
+
+    # Roles were created, renamed or deleted, rebuild on next use
+    def invalidate_guild(self, guild_id):
+        self._guilds.pop(int(guild_id), None)
+
+    def member_updated(self, guild_id, member):
+        roster = self._guilds.get(int(guild_id))
+        if roster is None:
+            return
+        role_ids = {int(role.id) for role in member.roles}
+        member_id = int(member.id)
+        for role_id, members in roster.role_members.items():
+            if role_id in role_ids and member_id not in members:
+                members.add(member_id)
+                roster.changed()
+            elif role_id not in role_ids and member_id in members:
+                members.discard(member_id)
+                roster.changed()
+
+    def member_removed(self, guild_id, member_id):
+        roster = self._guilds.get(int(guild_id))
+        if roster is None:
+            return
+        member_id = int(member_id)
+        for members in roster.role_members.values():
+            members.discard(member_id)
+        roster.permission_holders.discard(member_id)
+        roster.changed()
+
+    # A user's specific command permissions were granted or dropped
+    def permissions_updated(self, guild_id, user_id):
+        roster = self._guilds.get(int(guild_id))
+        if roster is None:
+            return
+        if self.role_data["permissions"].get(str(user_id)):
+            roster.permission_holders.add(int(user_id))
+        else:
+            roster.permission_holders.discard(int(user_id))
+        roster.changed()
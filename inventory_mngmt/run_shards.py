@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+
+from dotenv import load_dotenv
+
+# Run the bot as several processes, one per gateway shard, so guilds are spread across cores.
+# Each process gets its shard_id and only opens the banks of the guilds Discord routes to it.
+# A shard that exits with an error is started again after RESTART_DELAY seconds.
+#
+#   python run_shards.py --shards 4
+
+RESTART_DELAY = 5
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inventory_bot.py')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run one bot process per shard.")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("shard_count", os.cpu_count() or 1)),
+                        help="number of shards, defaults to shard_count or the number of CPUs")
+    return parser.parse_args(argv)
+
+def start_shard(shard_id, shard_count):
+    env = dict(os.environ, shard_id=str(shard_id), shard_count=str(shard_count))
+    return subprocess.Popen([sys.executable, BOT_SCRIPT], env=env)
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+    processes = {shard_id: start_shard(shard_id, args.shards) for shard_id in range(args.shards)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Shards write out their pending changes on the way down, so wait for every one of them
+    while processes:
+        for shard_id, process in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping or code == 0:
+                del processes[shard_id]
+            else:
+                print(f"Shard {shard_id} exited with {code}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                if stopping:
+                    del processes[shard_id]
+                else:
+                    processes[shard_id] = start_shard(shard_id, args.shards)
+        time.sleep(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import re
+import json
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+
+from croniter import croniter
+
+from persistence import worker, write_text_atomic
+
+# Items named after how long they last, e.g. "3h Mill" or "30m Industry", are boosts
+# that run for that long once used
+DURATION_PATTERN = re.compile(r'^(\d+)\s*([mhdw])\b', re.IGNORECASE)
+DURATION_UNITS = {"m": 60, "h": 60 * 60, "d": 24 * 60 * 60, "w": 7 * 24 * 60 * 60}
+
+# How long one unit of an item lasts once used, in seconds, None if it isn't a boost
+def boost_duration(item):
+    match = DURATION_PATTERN.match(item.strip())
+    if not match:
+        return None
+    return int(match.group(1)) * DURATION_UNITS[match.group(2).lower()]
+
+# Next time a cron expression fires after `after`, in UTC
+def next_cron_time(expression, after):
+    return croniter(expression, after).get_next(float)
+
+# Timed events of every open bank, in one min-heap of (when, seq, kind, guild_id, key).
+# A single task sleeps until the earliest entry is due and hands it to the handler
+# registered for its kind, so each event costs O(log n) and nothing ever scans the users.
+# Entries are never removed early: when a boost is extended or a grant is cancelled the old
+# entry stays in the heap and its handler finds it no longer matches the bank's state.
+# The heap itself isn't saved, each bank pushes its timers again when it is opened.
+class Scheduler:
+    def __init__(self):
+        self.client = None
+        self._heap = []
+        self._seq = itertools.count()
+        self._handlers = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # Decorator registering the coroutine called as handler(guild_id, key, when) for a kind of event
+    def handler(self, kind):
+        def decorator(func):
+            self._handlers[kind] = func
+            return func
+        return decorator
+
+    def push(self, when, kind, guild_id, key):
+        entry = (when, next(self._seq), kind, guild_id, key)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    # Entries waiting in the heap, including ones that will turn out to be stale
+    def pending(self):
+        return len(self._heap)
+
+    def start(self, client):
+        self.client = client
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if self._heap and self._heap[0][0] <= now:
+                when, _, kind, guild_id, key = heapq.heappop(self._heap)
+                try:
+                    await self._handlers[kind](guild_id, key, when)
+                except Exception as e:
+                    logging.error(f"Failed to run {kind} timer {key} for guild {guild_id}: {str(e)}")
+                continue
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+scheduler = Scheduler()
+
+# A guild's active boosts and recurring grants, saved to one JSON file:
+#   {"boosts": {"13526...": {"3h Mill": 1717177200.0}},
+#    "grants": {"1": {"id": 1, "role_id": "...", "item": "3h Mill", "quantity": 8, "cron": "0 18 * * 5",
+#                     "channel_id": "...", "created_by": "...", "last_run": null, "next_run": 1717178400.0}},
+#    "next_grant_id": 2}
+# Opening it pushes every boost expiry and next grant run onto the scheduler. A grant whose
+# run was missed while the bot was down runs once when it is opened, not once per missed run.
+class BankTimers:
+    def __init__(self, guild_id, path):
+        self.guild_id = guild_id
+        self.path = path
+        self._task = f"timers:{guild_id}"
+        # The persistence thread serializes under this lock while the event loop keeps changing things
+        self._lock = threading.Lock()
+        self.boosts = {}  # user_id -> {item: expires}
+        self.grants = {}  # grant id -> grant
+        self._next_grant_id = 1
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        self.boosts = data.get("boosts", {})
+        self.grants = {int(grant_id): grant for grant_id, grant in data.get("grants", {}).items()}
+        self._next_grant_id = data.get("next_grant_id", max(self.grants, default=0) + 1)
+        for user_id, boosts in self.boosts.items():
+            for item, expires in boosts.items():
+                scheduler.push(expires, "boost", self.guild_id, (user_id, item))
+        for grant in self.grants.values():
+            scheduler.push(grant["next_run"], "grant", self.guild_id, grant["id"])
+
+    def save(self):
+        worker.schedule(self._task, self._write)
+
+    # Runs on the persistence thread, returns the number of bytes written
+    def _write(self):
+        with self._lock:
+            text = json.dumps({"boosts": self.boosts, "grants": self.grants, "next_grant_id": self._next_grant_id}, indent=4)
+        return write_text_atomic(self.path, text)
+
+    # Start or extend a user's boost, returns when it now runs out
+    def activate(self, user_id, item, seconds, now=None):
+        now = time.time() if now is None else now
+        user_id = str(user_id)
+        with self._lock:
+            boosts = self.boosts.setdefault(user_id, {})
+            expires = boosts[item] = round(max(boosts.get(item, now), now) + seconds, 3)
+        scheduler.push(expires, "boost", self.guild_id, (user_id, item))
+        self.save()
+        return expires
+
+    # A user's running boosts as (item, expires), soonest to run out first
+    def active_boosts(self, user_id, now=None):
+        now = time.time() if now is None else now
+        boosts = self.boosts.get(str(user_id), {})
+        return sorted(((item, expires) for item, expires in boosts.items() if expires > now), key=lambda boost: boost[1])
+
+    # End a boost whose timer came up, returns False if the timer is stale because it was extended
+    def expire(self, user_id, item, when):
+        boosts = self.boosts.get(user_id, {})
+        if boosts.get(item) != when:
+            return False
+        with self._lock:
+            del boosts[item]
+            if not boosts:
+                del self.boosts[user_id]
+        self.save()
+        return True
+
+    # Add a recurring grant of an item to everyone with a role, raises ValueError for a bad cron expression
+    def add_grant(self, role_id, item, quantity, cron, channel_id, created_by, now=None):
+        now = time.time() if now is None else now
+        if not croniter.is_valid(cron):
+            raise ValueError(f"'{cron}' is not a valid cron expression.")
+        if quantity <= 0:
+            raise ValueError("Quantity must be a positive number.")
+        grant = {
+            "id": self._next_grant_id, "role_id": str(role_id), "item": item, "quantity": quantity, "cron": cron,
+            "channel_id": str(channel_id), "created_by": str(created_by), "last_run": None,
+            "next_run": next_cron_time(cron, now)
+        }
+        with self._lock:
+            self.grants[grant["id"]] = grant
+            self._next_grant_id += 1
+        scheduler.push(grant["next_run"], "grant", self.guild_id, grant["id"])
+        self.save()
+        return grant
+
+    # Stop a recurring grant, returns it or None if there is no grant with that ID
+    def remove_grant(self, grant_id):
+        with self._lock:
+            grant = self.grants.pop(grant_id, None)
+        if grant is not None:
+            self.save()
+        return grant
+
+    # The grant a timer came up for, None if the timer is stale because the grant was removed
+    def due_grant(self, grant_id, when):
+        grant = self.grants.get(grant_id)
+        return grant if grant is not None and grant["next_run"] == when else None
+
+    # Record a grant's run and schedule the next one
+    def finish_grant(self, grant_id, when, now=None):
+        now = time.time() if now is None else now
+        grant = self.grants.get(grant_id)
+        if grant is None:
+            return
+        with self._lock:
+            grant["last_run"] = when
+            grant["next_run"] = next_cron_time(grant["cron"], max(when, now))
+        scheduler.push(grant["next_run"], "grant", self.guild_id, grant_id)
+        self.save()
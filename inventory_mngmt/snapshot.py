@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+import mmap
+import struct
+import tempfile
+
+# Compact binary inventory snapshot, designed to be memory-mapped and read lazily.
+#
+#   header   magic, version, journal seq, item count, user count, item table offset, index offset
+#   records  (item_id, quantity) pairs, each user's records stored contiguously
+#   items    the interned item table: length-prefixed UTF-8 names, item_id is the position
+#   index    (user_id, records offset, record count) per user, sorted by user_id
+#
+# A user is found by binary search over the fixed-width index, so opening a snapshot only
+# reads the header and the item table no matter how many users it holds.
+MAGIC = b'CGBS'
+VERSION = 1
+HEADER = struct.Struct('<4sIQIIQQ')
+RECORD = struct.Struct('<Iq')
+INDEX_ENTRY = struct.Struct('<QQI')
+ITEM_LENGTH = struct.Struct('<H')
+
+SNAPSHOT_PATTERN = re.compile(r'^inventories-(\d+)\.snap$')
+
+def snapshot_path(directory, seq):
+    return os.path.join(directory, f'inventories-{seq:012d}.snap')
+
+# Snapshots in a directory as (seq, path), oldest first
+def list_snapshots(directory):
+    snapshots = []
+    for name in os.listdir(directory):
+        match = SNAPSHOT_PATTERN.match(name)
+        if match:
+            snapshots.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(snapshots)
+
+class SnapshotReader:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.seq, item_count, self.user_count, items_offset, self._index_offset = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} inventory snapshot")
+            self.items = []
+            position = items_offset
+            for _ in range(item_count):
+                (length,) = ITEM_LENGTH.unpack_from(self._map, position)
+                position += ITEM_LENGTH.size
+                self.items.append(sys.intern(self._map[position:position + length].decode('utf-8')))
+                position += length
+        except Exception:
+            self.close()
+            raise
+
+    def _index_entry(self, position):
+        return INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * INDEX_ENTRY.size)
+
+    def _find(self, user_id):
+        try:
+            key = int(user_id)
+        except ValueError:
+            return None
+        low, high = 0, self.user_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._index_entry(middle)
+            if entry[0] < key:
+                low = middle + 1
+            elif entry[0] > key:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def _decode(self, offset, count):
+        return {
+            self.items[item_id]: quantity
+            for item_id, quantity in RECORD.iter_unpack(self._map[offset:offset + count * RECORD.size])
+        }
+
+    def __contains__(self, user_id):
+        return self._find(user_id) is not None
+
+    # A user's inventory as a new dict, or None if the snapshot doesn't have them
+    def load(self, user_id):
+        entry = self._find(user_id)
+        if entry is None:
+            return None
+        return self._decode(entry[1], entry[2])
+
+    # Every item anyone in the snapshot holds
+    def item_names(self):
+        return list(self.items)
+
+    def user_ids(self):
+        for position in range(self.user_count):
+            yield str(self._index_entry(position)[0])
+
+    # Every (user_id, inventory) in the snapshot, decoded one at a time
+    def iter_inventories(self):
+        for position in range(self.user_count):
+            user_id, offset, count = self._index_entry(position)
+            yield str(user_id), self._decode(offset, count)
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+# Write (user_id, inventory) pairs as a snapshot, via a temp file renamed into place.
+# Returns the size of the snapshot in bytes.
+def write_snapshot(path, seq, inventories):
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, seq, 0, 0, 0, 0))
+            item_ids = {}
+            index = []
+            offset = HEADER.size
+            for user_id, inventory in inventories:
+                records = []
+                for item, quantity in inventory.items():
+                    if quantity <= 0:
+                        continue
+                    if item not in item_ids:
+                        item_ids[item] = len(item_ids)
+                    records.append(RECORD.pack(item_ids[item], quantity))
+                if not records:
+                    continue
+                file.write(b''.join(records))
+                index.append((int(user_id), offset, len(records)))
+                offset += len(records) * RECORD.size
+            items_offset = offset
+            for item in item_ids:
+                name = item.encode('utf-8')
+                file.write(ITEM_LENGTH.pack(len(name)) + name)
+                offset += ITEM_LENGTH.size + len(name)
+            index.sort()
+            file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in index))
+            size = file.tell()
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, VERSION, seq, len(item_ids), len(index), items_offset, offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return size
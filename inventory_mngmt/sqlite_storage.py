@@ -0,0 +1,148 @@
+import time
+import sqlite3
+import itertools
+import threading
+
+from inventory_store import LazyInventories
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS holdings (
+    user_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (user_id, item)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS holdings_by_item ON holdings (item, quantity);
+CREATE TABLE IF NOT EXISTS permissions (
+    user_id TEXT NOT NULL,
+    command TEXT NOT NULL,
+    PRIMARY KEY (user_id, command)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mod_roles (
+    role_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS processed_keys (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS processed_keys_by_expiry ON processed_keys (expires);
+"""
+
+# SQLite storage for inventories and roles, used when storage_backend=sqlite.
+# Inventory changes are applied as single-row upserts inside a transaction, so a trade
+# either lands for both users or not at all, and nothing is ever rewritten in full.
+class SqliteStorage:
+    def __init__(self, path):
+        self.path = path
+        # Loads run on the main thread at startup, writes on the persistence thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def is_empty(self):
+        with self._lock:
+            holdings = self.connection.execute("SELECT 1 FROM holdings LIMIT 1").fetchone()
+            permissions = self.connection.execute("SELECT 1 FROM permissions LIMIT 1").fetchone()
+        return holdings is None and permissions is None
+
+    # Inventories are read one user at a time, on first access
+    def load_inventories(self):
+        return LazyInventories(self)
+
+    # A user's inventory as a new dict, or None if they hold nothing
+    def load(self, user_id):
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT item, quantity FROM holdings WHERE user_id = ?", (str(user_id),)
+            ).fetchall()
+        return dict(rows) if rows else None
+
+    def __contains__(self, user_id):
+        with self._lock:
+            row = self.connection.execute("SELECT 1 FROM holdings WHERE user_id = ? LIMIT 1", (str(user_id),)).fetchone()
+        return row is not None
+
+    def user_ids(self):
+        with self._lock:
+            rows = self.connection.execute("SELECT DISTINCT user_id FROM holdings").fetchall()
+        return [user_id for (user_id,) in rows]
+
+    # Every (user_id, inventory), read in one query
+    def iter_inventories(self):
+        with self._lock:
+            rows = self.connection.execute("SELECT user_id, item, quantity FROM holdings ORDER BY user_id").fetchall()
+        for user_id, holdings in itertools.groupby(rows, key=lambda row: row[0]):
+            yield user_id, {item: quantity for _, item, quantity in holdings}
+
+    def item_names(self):
+        with self._lock:
+            rows = self.connection.execute("SELECT DISTINCT item FROM holdings").fetchall()
+        return [item for (item,) in rows]
+
+    # Apply [user_id, item, delta] changes from one or more journal records in one transaction,
+    # together with the [key, expires] pairs of the commands that made them
+    def apply_changes(self, changes, keys=()):
+        with self._lock, self.connection:
+            if keys:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO processed_keys (key, expires) VALUES (?, ?)", keys
+                )
+                self.connection.execute("DELETE FROM processed_keys WHERE expires <= ?", (time.time(),))
+            for user_id, item, delta in changes:
+                self.connection.execute(
+                    "INSERT INTO holdings (user_id, item, quantity) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id, item) DO UPDATE SET quantity = quantity + excluded.quantity",
+                    (user_id, item, delta)
+                )
+                self.connection.execute(
+                    "DELETE FROM holdings WHERE user_id = ? AND item = ? AND quantity <= 0",
+                    (user_id, item)
+                )
+
+    # Replace all holdings, used for the one-time import from JSON
+    def replace_inventories(self, inventories):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM holdings")
+            self.connection.executemany(
+                "INSERT INTO holdings (user_id, item, quantity) VALUES (?, ?, ?)",
+                [(user_id, item, quantity)
+                 for user_id, inventory in inventories.items()
+                 for item, quantity in inventory.items() if quantity > 0]
+            )
+
+    # Processed keys that haven't expired yet as [key, expires] pairs, oldest first
+    def load_processed_keys(self, now):
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT key, expires FROM processed_keys WHERE expires > ? ORDER BY expires", (now,)
+            ).fetchall()
+        return [list(row) for row in rows]
+
+    def load_roles(self):
+        roles = {"permissions": {}, "mod_roles": []}
+        with self._lock:
+            permissions = self.connection.execute("SELECT user_id, command FROM permissions").fetchall()
+            mod_roles = self.connection.execute("SELECT role_id FROM mod_roles").fetchall()
+        for user_id, command in permissions:
+            roles["permissions"].setdefault(user_id, []).append(command)
+        roles["mod_roles"] = [role_id for (role_id,) in mod_roles]
+        return roles
+
+    def save_roles(self, roles):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM permissions")
+            self.connection.execute("DELETE FROM mod_roles")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO permissions (user_id, command) VALUES (?, ?)",
+                [(user_id, command) for user_id, commands in roles["permissions"].items() for command in commands]
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO mod_roles (role_id) VALUES (?)",
+                [(role_id,) for role_id in roles["mod_roles"]]
+            )
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
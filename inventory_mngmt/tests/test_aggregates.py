@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from aggregates import ItemIndex
+from guild_bank import GuildBank
+from persistence import worker
+
+GUILD_ID = 881509696882757643
+
+def open_bank(directory, backend):
+    return GuildBank(GUILD_ID, os.path.join(directory, str(GUILD_ID)), backend)
+
+def test_top_skips_stale_entries():
+    index = ItemIndex()
+    index.build([("1", {"3h Mill": 5}), ("2", {"3h Mill": 3})])
+    index.update("2", "3h Mill", 9)
+    index.update("1", "3h Mill", 0)
+    assert index.top("3h Mill") == [("2", 9)]
+    assert index.totals() == {"3h Mill": 9}
+    assert index.holder_count("3h Mill") == 1
+
+def test_changes_made_during_the_build_are_applied_after_it():
+    class ManualWorker:
+        def schedule(self, key, task):
+            self.task = task
+
+    manual = ManualWorker()
+    index = ItemIndex()
+    index.build_in_background(manual, "item_index:test", lambda: [("1", {"3h Mill": 5}), ("2", {"3h Mill": 3})])
+    index.update("2", "3h Mill", 7)
+    index.update("3", "30m Industry", 1)
+    assert not index.built
+
+    manual.task()
+    assert index.top("3h Mill") == [("2", 7), ("1", 5)]
+    assert index.totals() == {"3h Mill": 12, "30m Industry": 1}
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_index_is_built_off_the_event_loop_after_a_restart(tmp_path, backend):
+    bank = open_bank(tmp_path, backend)
+    bank.add_items([(user_id, "3h Mill", user_id) for user_id in range(1, 6)])
+    bank.save_inventories()
+    worker.flush()
+
+    bank = open_bank(tmp_path, backend)
+    bank.transfer_item(5, 1, "3h Mill", 4)
+    bank.add_item(6, "30m Industry", 2)
+    worker.flush()
+
+    assert bank.item_index.built
+    assert bank.item_index.top("3h Mill", 2) == [("1", 5), ("4", 4)]
+    assert bank.item_index.totals() == {"3h Mill": 15, "30m Industry": 2}
+    assert bank.item_index.holder_count("3h Mill") == 5
@@ -0,0 +1,27 @@
+import os
+
+from guild_bank import GuildBank
+from persistence import worker
+
+GUILD_ID = 881509696882757643
+
+def open_bank(directory, backend="json"):
+    return GuildBank(GUILD_ID, os.path.join(directory, str(GUILD_ID)), backend)
+
+def inventories(bank):
+    return {user_id: dict(inventory) for user_id, inventory in bank.user_inventories.items() if inventory}
+
+def test_changes_survive_a_restart(tmp_path):
+    bank = open_bank(tmp_path)
+    bank.add_item(1, "3h Mill", 8)
+    bank.save_inventories()
+    bank.transfer_item(1, 2, "3h Mill", 3)
+    bank.save_inventories()
+    bank.add_items([(2, "30m Industry", 1), (3, "30m Industry", 2)])
+    bank.save_inventories()
+    before = inventories(bank)
+    worker.flush()
+
+    assert inventories(open_bank(tmp_path)) == before == {
+        "1": {"3h Mill": 5}, "2": {"3h Mill": 3, "30m Industry": 1}, "3": {"30m Industry": 2}
+    }
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import guild_bank
+from guild_bank import GuildBank
+from idempotency import ProcessedKeys
+from persistence import worker
+
+GUILD_ID = 881509696882757643
+
+def open_bank(directory, backend):
+    return GuildBank(GUILD_ID, os.path.join(directory, str(GUILD_ID)), backend)
+
+def test_keys_expire_and_are_bounded():
+    keys = ProcessedKeys(ttl=10, limit=2)
+    keys.add(["a"], now=0)
+    keys.add(["b", "c"])
+    assert "a" not in keys
+    assert "b" in keys and "c" in keys
+    keys.add(["d"])
+    assert "b" not in keys and len(keys) == 2
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_processed_keys_survive_a_restart(tmp_path, backend):
+    bank = open_bank(tmp_path, backend)
+    bank.add_item(1, "3h Mill", 8)
+    bank.save_inventories(["interaction:1", "key:60275:bankadd:payout-1"])
+    worker.flush()
+
+    bank = open_bank(tmp_path, backend)
+    assert bank.find_processed(["interaction:2", "key:60275:bankadd:payout-1"]) == "key:60275:bankadd:payout-1"
+    assert bank.find_processed(["interaction:1"]) == "interaction:1"
+    assert bank.find_processed(["interaction:3"]) is None
+    assert bank.get_inventory(1) == {"3h Mill": 8}
+
+def test_processed_keys_survive_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(guild_bank, "JOURNAL_COMPACT_EVERY", 2)
+    bank = open_bank(tmp_path, "json")
+    bank.add_item(1, "3h Mill", 1)
+    bank.save_inventories(["interaction:1"])
+    bank.add_item(1, "3h Mill", 1)
+    bank.save_inventories(["interaction:2"])
+    worker.flush()
+
+    bank = open_bank(tmp_path, "json")
+    assert bank.find_processed(["interaction:1"]) == "interaction:1"
+    assert bank.get_inventory(1) == {"3h Mill": 2}
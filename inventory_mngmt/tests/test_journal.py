@@ -0,0 +1,50 @@
+import os
+
+from journal import Journal, apply_change
+
+def test_records_round_trip(tmp_path):
+    journal = Journal(os.path.join(tmp_path, 'inventories.journal'))
+    first = journal.record([["1", "3h Mill", 8]])
+    second = journal.record([["1", "3h Mill", -3], ["2", "3h Mill", 3]], keys=[["interaction:5", 1717166400.0]])
+    journal.write([first, second])
+    journal.close()
+
+    replayed = Journal(journal.path)
+    assert list(replayed.replay()) == [first, second]
+    assert replayed.seq == 2
+
+def test_replay_starts_after_the_snapshot(tmp_path):
+    journal = Journal(os.path.join(tmp_path, 'inventories.journal'))
+    journal.write([journal.record([["1", "3h Mill", 1]]) for _ in range(3)])
+    journal.close()
+
+    assert [record["seq"] for record in Journal(journal.path).replay(after_seq=2)] == [3]
+
+def test_torn_tail_is_ignored(tmp_path):
+    journal = Journal(os.path.join(tmp_path, 'inventories.journal'))
+    journal.write([journal.record([["1", "3h Mill", 8]])])
+    journal.close()
+    with open(journal.path, 'ab') as file:
+        file.write(b'{"seq":2,"changes":[["1","3h M')
+
+    assert [record["seq"] for record in Journal(journal.path).replay()] == [1]
+
+def test_duplicated_record_is_applied_once(tmp_path):
+    journal = Journal(os.path.join(tmp_path, 'inventories.journal'))
+    record = journal.record([["1", "3h Mill", 8]])
+    journal.write([record])
+    journal.write([record])
+    journal.close()
+
+    inventories = {}
+    for record in Journal(journal.path).replay():
+        for user_id, item, delta in record["changes"]:
+            apply_change(inventories, user_id, item, delta)
+    assert inventories == {"1": {"3h Mill": 8}}
+
+def test_apply_change_drops_items_that_run_out():
+    inventories = {}
+    apply_change(inventories, "1", "3h Mill", 2)
+    apply_change(inventories, "1", "30m Industry", 1)
+    apply_change(inventories, "1", "3h Mill", -2)
+    assert inventories == {"1": {"30m Industry": 1}}
@@ -0,0 +1,70 @@
+import os
+
+import ledger as ledger_module
+from ledger import Ledger
+from persistence import worker
+
+def open_ledger(directory):
+    return Ledger(os.path.join(directory, 'ledger.jsonl'), os.path.join(directory, 'ledger.idx'), task="ledger:test")
+
+def test_history_after_restart(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.record("add", 1, 2, "3h Mill", 8)
+    ledger.record("remove", 1, 2, "3h Mill", 3)
+    ledger.record("add", 1, 3, "30m Industry", 1)
+    worker.flush()
+
+    ledger = open_ledger(tmp_path)
+    assert [event["kind"] for event in ledger.history(2)] == ["remove", "add"]
+    assert [event["subject"] for event in ledger.item_history("30m Industry")] == ["3"]
+
+def test_torn_last_line_is_dropped_on_restart(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.record("add", 1, 2, "3h Mill", 8)
+    worker.flush()
+    with open(ledger.path, 'ab') as file:
+        file.write(b'{"ts":1717166400.0,"ki')
+    with open(ledger.index_path, 'ab') as file:
+        file.write(b'[123,2024')
+
+    ledger = open_ledger(tmp_path)
+    ledger.record("add", 1, 2, "30m Industry", 1)
+    worker.flush()
+
+    ledger = open_ledger(tmp_path)
+    assert [event["item"] for event in ledger.history(2)] == ["30m Industry", "3h Mill"]
+    with open(ledger.index_path, 'rb') as file:
+        assert len(file.read().splitlines()) == 2
+
+def test_failed_write_is_cut_back_before_the_retry(tmp_path, monkeypatch):
+    ledger = open_ledger(tmp_path)
+    ledger.record("add", 1, 2, "3h Mill", 8)
+    worker.flush()
+
+    # The next write gets half of its bytes onto the disk and then fails
+    class FailingFile:
+        def __init__(self, file):
+            self._file = file
+
+        def tell(self):
+            return self._file.tell()
+
+        def write(self, data):
+            self._file.write(data[:len(data) // 2])
+            self._file.flush()
+            raise OSError("No space left on device")
+
+        def close(self):
+            self._file.close()
+
+    def failing_open(path, mode):
+        return FailingFile(open(path, mode)) if mode == 'ab' else open(path, mode)
+
+    monkeypatch.setattr(ledger_module, "open", failing_open, raising=False)
+    ledger.record("remove", 1, 2, "3h Mill", 3)
+    worker.flush()
+    monkeypatch.undo()
+    worker.flush()
+
+    ledger = open_ledger(tmp_path)
+    assert [event["kind"] for event in ledger.history(2)] == ["remove", "add"]
@@ -0,0 +1,74 @@
+import os
+
+import guild_bank
+from guild_bank import GuildBank
+from inventory_store import LazyInventories
+from persistence import worker
+from snapshot import SnapshotReader, list_snapshots, snapshot_path, write_snapshot
+
+GUILD_ID = 881509696882757643
+
+def test_snapshot_round_trip(tmp_path):
+    path = snapshot_path(tmp_path, 7)
+    inventories = {
+        "135260000000000000": {"3h Mill": 8, "30m Industry": 1},
+        "60275000000000000": {"30m Industry": 4},
+        "99": {"3h Mill": 0},
+    }
+    write_snapshot(path, 7, inventories.items())
+
+    reader = SnapshotReader(path)
+    try:
+        assert reader.seq == 7
+        assert list_snapshots(tmp_path) == [(7, path)]
+        assert reader.load("135260000000000000") == {"3h Mill": 8, "30m Industry": 1}
+        assert reader.load("99") is None
+        assert "60275000000000000" in reader and "1" not in reader
+        assert dict(reader.iter_inventories()) == {
+            "60275000000000000": {"30m Industry": 4},
+            "135260000000000000": {"3h Mill": 8, "30m Industry": 1},
+        }
+        assert sorted(reader.item_names()) == ["30m Industry", "3h Mill"]
+    finally:
+        reader.close()
+
+def test_lazy_inventories_load_on_first_access(tmp_path):
+    path = snapshot_path(tmp_path, 1)
+    write_snapshot(path, 1, [("1", {"3h Mill": 2}), ("2", {"30m Industry": 1})])
+    reader = SnapshotReader(path)
+    try:
+        inventories = LazyInventories(reader)
+        assert len(inventories) == 2 and not inventories.loaded_items()
+        inventories["1"]["3h Mill"] += 1
+        inventories["3"] = {"3h Mill": 5}
+        del inventories["2"]
+        assert dict(inventories) == {"1": {"3h Mill": 3}, "3": {"3h Mill": 5}}
+        assert inventories.deleted_ids() == {"2"}
+    finally:
+        reader.close()
+
+def test_compaction_keeps_every_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(guild_bank, "JOURNAL_COMPACT_EVERY", 3)
+    directory = os.path.join(tmp_path, str(GUILD_ID))
+    bank = GuildBank(GUILD_ID, directory)
+    for user_id in range(1, 6):
+        bank.add_item(user_id, "3h Mill", user_id)
+        bank.save_inventories()
+    worker.flush()
+    assert list_snapshots(directory)
+
+    # A second generation carries over the users that were never loaded from the first
+    bank = GuildBank(GUILD_ID, directory)
+    for _ in range(3):
+        bank.add_item(6, "30m Industry", 1)
+        bank.save_inventories()
+    worker.flush()
+    bank.remove_item(1, "3h Mill", 1)
+    bank.save_inventories()
+    worker.flush()
+
+    reopened = GuildBank(GUILD_ID, directory)
+    assert {user_id: dict(inventory) for user_id, inventory in reopened.user_inventories.items() if inventory} == {
+        "2": {"3h Mill": 2}, "3": {"3h Mill": 3}, "4": {"3h Mill": 4}, "5": {"3h Mill": 5}, "6": {"30m Industry": 3}
+    }
+    assert len(list_snapshots(directory)) <= 2